@@ -1,11 +1,115 @@
 import barcode
 from barcode.writer import ImageWriter
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
-import os
+from PIL import Image, ImageDraw
+from core import code128_raster
+from core.code128_encoder import encode_code128
+from core.code_image import GenerationBatch, generate_batch, check_image_mode, to_bilevel, to_image_mode
+from core.font_registry import label_fonts
+
+
+class BarcodeBatch(GenerationBatch):
+    '''BarcodeGenerator.generate_many 1回分（サイズは (幅, 高さ)）'''
+    
+    def generate(self, barcode_value, display_text, size):
+        target_width, target_height = size
+        return self.generator.generate_barcode_with_text(barcode_value, display_text,
+                                                         target_width, target_height, batch=self)
+
 
 class BarcodeGenerator:
-    def generate_barcode_with_text(self, barcode_value, display_text, target_width=200, target_height=100):
+    def __init__(self, engine=None, dpi=None, cache=None, mode='RGB'):
+        '''
+        engine: 'numpy' (バー配列を目標サイズで直接描画) または
+                'imagewriter' (python-barcodeのImageWriterで生成)
+                省略時はNumPyが使えれば 'numpy'
+        dpi: 指定するとサイズをポイントとみなし、そのDPIのピクセル数で描画
+        cache: RenderedCodeCache（生成済み画像を再利用）
+        mode: 生成する画像の画素形式 'RGB' / 'L' / '1'
+              'L' と '1' はキャンバスからその形式で合成し、RGBへの変換を行わない
+        '''
+        if engine is None:
+            engine = 'numpy' if code128_raster.is_available() else 'imagewriter'
+        self.engine = engine
+        self.dpi = dpi
+        self.cache = cache
+        self.mode = check_image_mode(mode)
+    
+    def _draw_text(self, img, display_text, top, text_height, batch=None):
+        '''画像下部のテキスト領域に中央揃えでテキストを描画'''
+        draw = ImageDraw.Draw(img)
+        font_size = int(text_height * 0.6)
+        font = batch.font(font_size) if batch else label_fonts.get_font(font_size)
+        
+        bbox = draw.textbbox((0, 0), display_text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_x = (img.width - text_width) // 2
+        text_y = top + (text_height - font_size) // 2
+        
+        draw.text((text_x, text_y), display_text, fill='black', font=font)
+    
+    def generate_many(self, records, pipeline=None, transform=None):
+        '''
+        複数件をまとめて生成し、画像を入力順に返すジェネレータ（取り出した分だけ生成する）
+        records: (barcode_value, display_text, (target_width, target_height)) の列
+        pipeline: RenderPipeline / SharedMemoryRenderPipeline を渡すとワーカーで並列に生成
+        transform: transform(画像, サイズ) を各画像に続けて適用し、その結果を返す（ワーカー側で実行）
+        '''
+        return generate_batch(BarcodeBatch(self, transform), records, pipeline)
+    
+    def generate_barcode_with_text(self, barcode_value, display_text, target_width=200, target_height=100,
+                                   batch=None):
+        '''batch: generate_many から呼ばれた場合のバッチ（フォント・ImageWriterを共有する）'''
+        cache_key = None
+        if self.cache is not None:
+            options = {'engine': self.engine, 'dpi': self.dpi}
+            if self.mode != 'RGB':
+                options['mode'] = self.mode
+            cache_key = self.cache.make_key(
+                'code128', barcode_value, display_text, (target_width, target_height), options
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if self.engine == 'numpy':
+            img = self._generate_numpy(barcode_value, display_text, target_width, target_height, batch)
+        else:
+            img = self._generate_imagewriter(barcode_value, display_text, target_width, target_height, batch)
+        
+        if img is not None and cache_key is not None:
+            self.cache.put(cache_key, img)
+        return img
+    
+    def _generate_numpy(self, barcode_value, display_text, target_width, target_height, batch=None):
+        '''バー配列を目標ピクセルサイズで直接描画（リサンプリングなし）'''
+        try:
+            if self.dpi:
+                target_width = int(round(target_width * self.dpi / 72))
+                target_height = int(round(target_height * self.dpi / 72))
+            
+            text_height = int(target_height * 0.3)
+            barcode_height = target_height - text_height
+            
+            modules = encode_code128(barcode_value)
+            bitmap = code128_raster.render_bars(modules, target_width, target_height)
+            bitmap[barcode_height:] = 255
+            
+            img = Image.fromarray(bitmap, 'L')
+            if self.mode == '1':
+                # バーは白黒のみなので変換しても形は変わらない（テキストも1ビットで描画する）
+                img = to_bilevel(img)
+            self._draw_text(img, display_text, barcode_height, text_height, batch)
+            
+            return to_image_mode(img, self.mode)
+        
+        except Exception as e:
+            print(f"バーコード生成エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def _generate_imagewriter(self, barcode_value, display_text, target_width, target_height, batch=None):
         try:
             # 超高解像度で生成（4倍）
             render_scale = 4
@@ -13,9 +117,17 @@ class BarcodeGenerator:
             render_height = target_height * render_scale
             
             code128 = barcode.get_barcode_class('code128')
-            barcode_instance = code128(str(barcode_value), writer=ImageWriter())
+            if batch:
+                # バッチ内ではライターと書き出し用バッファをスレッドごとに使い回す
+                writer = batch.scratch('writer', ImageWriter)
+                buffer = batch.scratch('buffer', BytesIO)
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                writer = ImageWriter()
+                buffer = BytesIO()
+            barcode_instance = code128(str(barcode_value), writer=writer)
             
-            buffer = BytesIO()
             # 超高品質設定
             barcode_instance.write(buffer, options={
                 'module_width': 0.6,  # バーの幅
@@ -28,7 +140,8 @@ class BarcodeGenerator:
             })
             buffer.seek(0)
             
-            barcode_img = Image.open(buffer)
+            # 白黒なのでグレースケールで合成する
+            barcode_img = Image.open(buffer).convert('L')
             
             # テキスト部分の高さ
             text_height = int(render_height * 0.3)
@@ -38,50 +151,17 @@ class BarcodeGenerator:
             barcode_img = barcode_img.resize((render_width, barcode_height), Image.Resampling.LANCZOS)
             
             # 超高解像度キャンバスを作成
-            combined_img = Image.new('RGB', (render_width, render_height), 'white')
+            combined_img = Image.new('L', (render_width, render_height), 'white')
             combined_img.paste(barcode_img, (0, 0))
             
             # テキスト描画
-            draw = ImageDraw.Draw(combined_img)
-            
-            font = None
-            font_size = int(text_height * 0.6)
-            font_paths = [
-                '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',
-                '/System/Library/Fonts/ヒラギノ角ゴシック W6.ttc',
-                '/System/Library/Fonts/Hiragino Sans GB.ttc',
-                '/Library/Fonts/Arial Unicode.ttf',
-                '/System/Library/Fonts/Supplemental/Arial Unicode.ttf',
-                '/System/Library/Fonts/Supplemental/Arial.ttf'
-            ]
-            
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        font = ImageFont.truetype(font_path, font_size)
-                        break
-                    except:
-                        continue
-            
-            if font is None:
-                try:
-                    font = ImageFont.truetype("arial.ttf", font_size)
-                except:
-                    font = ImageFont.load_default()
-            
-            # テキストを中央配置
-            bbox = draw.textbbox((0, 0), display_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_x = (render_width - text_width) // 2
-            text_y = barcode_height + (text_height - font_size) // 2
-            
-            draw.text((text_x, text_y), display_text, fill='black', font=font)
+            self._draw_text(combined_img, display_text, barcode_height, text_height, batch)
             
             # 最終的に目標サイズにリサイズ（超高品質）
             final_img = combined_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
             
-            return final_img
-            
+            return to_image_mode(final_img, self.mode)
+        
         except Exception as e:
             print(f"バーコード生成エラー: {e}")
             import traceback
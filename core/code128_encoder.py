@@ -0,0 +1,78 @@
+import barcode
+import threading
+from collections import OrderedDict
+
+
+def bar_runs(modules):
+    '''モジュール列を黒バーの (開始位置, 幅) のリストに変換'''
+    runs = []
+    start = None
+    for i, module in enumerate(modules):
+        if module == '1':
+            if start is None:
+                start = i
+        elif start is not None:
+            runs.append((start, i - start))
+            start = None
+    if start is not None:
+        runs.append((start, len(modules) - start))
+    return runs
+
+
+class Code128Encoder:
+    '''Code128のエンコード結果（モジュール列とバー幅列）をLRUでキャッシュする'''
+    
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._code128 = barcode.get_barcode_class('code128')
+    
+    def _lookup(self, barcode_value):
+        key = str(barcode_value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        modules = self._code128(key).build()[0]
+        entry = (modules, tuple(bar_runs(modules)))
+        
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+    
+    def encode(self, barcode_value):
+        '''モジュール列（'1'=黒, '0'=白）を返す'''
+        return self._lookup(barcode_value)[0]
+    
+    def encode_runs(self, barcode_value):
+        '''黒バーの (開始位置, 幅) のタプルを返す'''
+        return self._lookup(barcode_value)[1]
+    
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 全レンダラーで共有するエンコーダー
+default_encoder = Code128Encoder()
+
+
+def encode_code128(barcode_value):
+    '''Code128のモジュール列（'1'=黒, '0'=白）を返す'''
+    return default_encoder.encode(barcode_value)
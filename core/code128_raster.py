@@ -0,0 +1,36 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from core.code128_vector import QUIET_ZONE_MODULES
+
+
+def is_available():
+    return np is not None
+
+
+def render_bars(modules, width, height, quiet_zone=QUIET_ZONE_MODULES):
+    '''
+    モジュール列を width x height のグレースケール配列（0=黒, 255=白）に描画
+    1モジュールが整数ピクセルになるように揃え、余りは左右に均等配分する
+    '''
+    bars = np.frombuffer(modules.encode('ascii'), dtype=np.uint8) == ord('1')
+    total_modules = len(modules) + quiet_zone * 2
+    module_px = width // total_modules
+    
+    row = np.full(width, 255, dtype=np.uint8)
+    if module_px >= 1:
+        # モジュール幅をピクセル単位にスナップ
+        offset = (width - module_px * total_modules) // 2 + quiet_zone * module_px
+        pixels = np.repeat(bars, module_px)
+        row[offset:offset + pixels.size][pixels] = 0
+    else:
+        # 幅が足りない場合は最近傍でモジュールを割り当てる
+        index = np.arange(width) * total_modules // width - quiet_zone
+        inside = (index >= 0) & (index < bars.size)
+        row[inside & bars[np.clip(index, 0, bars.size - 1)]] = 0
+    
+    bitmap = np.empty((height, width), dtype=np.uint8)
+    bitmap[:] = row
+    return bitmap
@@ -0,0 +1,110 @@
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from core.code128_encoder import default_encoder
+
+# ラスター版(ImageWriter: module_width 0.6mm, quiet_zone 4mm)とほぼ同じ余白
+QUIET_ZONE_MODULES = 7
+# 下部テキスト領域の割合（ラスター版と同じ）
+TEXT_RATIO = 0.3
+LABEL_FONT = 'HeiseiKakuGo-W5'
+# PyMuPDF内蔵の日本語フォント
+FITZ_LABEL_FONT = 'japan'
+
+
+def register_label_font(font_name=LABEL_FONT):
+    '''ラベル用フォントを登録して名前を返す（登録できなければHelvetica）'''
+    try:
+        pdfmetrics.getFont(font_name)
+        return font_name
+    except KeyError:
+        pass
+    try:
+        pdfmetrics.registerFont(UnicodeCIDFont(font_name))
+        return font_name
+    except Exception:
+        return 'Helvetica'
+
+
+class Code128VectorRenderer:
+    '''Code128をreportlabキャンバスへ矩形とテキストで直接描画する'''
+    
+    def __init__(self, font_name=LABEL_FONT):
+        self.font_name = register_label_font(font_name)
+    
+    def draw(self, can, barcode_value, display_text, x, y, width, height):
+        '''(x, y) を左下とする width x height の範囲にバーコードを描画'''
+        try:
+            modules = default_encoder.encode(barcode_value)
+            total_modules = len(modules) + QUIET_ZONE_MODULES * 2
+            module_width = width / total_modules
+            
+            text_height = height * TEXT_RATIO
+            bar_bottom = y + text_height
+            bar_height = height - text_height
+            
+            can.saveState()
+            can.setFillColorRGB(0, 0, 0)
+            
+            path = can.beginPath()
+            for start, run in default_encoder.encode_runs(barcode_value):
+                bar_x = x + (start + QUIET_ZONE_MODULES) * module_width
+                path.rect(bar_x, bar_bottom, run * module_width, bar_height)
+            can.drawPath(path, stroke=0, fill=1)
+            
+            # テキストを中央配置（幅を超える場合は縮小）
+            if display_text:
+                font_size = text_height * 0.6
+                text_width = pdfmetrics.stringWidth(display_text, self.font_name, font_size)
+                if text_width > width:
+                    font_size *= width / text_width
+                can.setFont(self.font_name, font_size)
+                baseline = y + (text_height - font_size) / 2 + font_size * 0.12
+                can.drawCentredString(x + width / 2, baseline, display_text)
+            
+            can.restoreState()
+            return True
+        
+        except Exception as e:
+            print(f"バーコード描画エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def draw_on_page(self, page, barcode_value, display_text, rect):
+        '''PyMuPDFのページへ描画（rect は左上原点のページ座標）'''
+        try:
+            import fitz
+            
+            modules = default_encoder.encode(barcode_value)
+            total_modules = len(modules) + QUIET_ZONE_MODULES * 2
+            module_width = rect.width / total_modules
+            
+            text_height = rect.height * TEXT_RATIO
+            bar_height = rect.height - text_height
+            
+            shape = page.new_shape()
+            for start, run in default_encoder.encode_runs(barcode_value):
+                bar_x = rect.x0 + (start + QUIET_ZONE_MODULES) * module_width
+                shape.draw_rect(fitz.Rect(bar_x, rect.y0, bar_x + run * module_width, rect.y0 + bar_height))
+            shape.finish(color=None, fill=(0, 0, 0), width=0)
+            
+            # テキストを中央配置（幅を超える場合は縮小）
+            if display_text:
+                font_size = text_height * 0.6
+                for _ in range(8):
+                    text_top = rect.y0 + bar_height + (text_height - font_size) / 2 - font_size * 0.2
+                    text_rect = fitz.Rect(rect.x0, text_top, rect.x1, rect.y1 + font_size)
+                    rc = shape.insert_textbox(text_rect, display_text, fontname=FITZ_LABEL_FONT,
+                                              fontsize=font_size, align=fitz.TEXT_ALIGN_CENTER)
+                    if rc >= 0:
+                        break
+                    font_size *= 0.85
+            
+            shape.commit()
+            return True
+        
+        except Exception as e:
+            print(f"バーコード描画エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
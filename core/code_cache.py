@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from importlib import metadata
+from io import BytesIO
+from PIL import Image
+
+# 描画結果を変える要因（キャッシュ形式と描画に使うライブラリのバージョン）。キーに含めて古い画像を使わない
+CACHE_FORMAT = 1
+
+
+def render_versions():
+    '''キャッシュキーに含める描画系ライブラリのバージョン'''
+    versions = {'format': CACHE_FORMAT}
+    for package in ('python-barcode', 'qrcode', 'Pillow'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+RENDER_VERSIONS = render_versions()
+
+
+def default_cache_dir():
+    '''永続キャッシュの既定保存先'''
+    return os.path.join(os.path.expanduser('~'), '.barcode_qrcode_pdf', 'code_cache')
+
+
+class RenderedCodeCache:
+    '''
+    生成済みコード画像のキャッシュ
+    キーは (種類, 値, 表示テキスト, サイズ, 描画オプション) のハッシュ
+    メモリ上はバイト数上限つきLRU、cache_dir を指定するとPNGとしてディスクにも保存する
+    （ディスク側も max_disk_bytes を超えたら古いものから削除する）
+    返す画像は共有されるため、呼び出し側で書き換えないこと
+    '''
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, cache_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        # ディスク上のファイル (パス: バイト数) を古い順に保持
+        self._disk_files = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._scan_disk()
+            except Exception as e:
+                print(f"キャッシュディレクトリ作成エラー: {e}")
+                self.cache_dir = None
+    
+    def __getstate__(self):
+        # 別プロセスへは設定だけを渡し、メモリ上の内容は引き継がない
+        return {'max_bytes': self.max_bytes, 'cache_dir': self.cache_dir, 'max_disk_bytes': self.max_disk_bytes}
+    
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'], state['cache_dir'], state['max_disk_bytes'])
+    
+    @staticmethod
+    def make_key(symbology, value, display_text, size, options=None):
+        payload = json.dumps(
+            [symbology, str(value), str(display_text), list(size), options or {}, RENDER_VERSIONS],
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _image_bytes(image):
+        return image.width * image.height * len(image.getbands())
+    
+    def _scan_disk(self):
+        '''既存のキャッシュファイルを更新日時の古い順に登録し、上限を超えていれば削除する'''
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.png'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._disk_files[path] = size
+            self._disk_size += size
+        self._evict_disk()
+    
+    def _evict_disk(self):
+        '''ディスク上の合計が上限以下になるまで古いファイルを削除'''
+        while True:
+            with self._lock:
+                if self._disk_size <= self.max_disk_bytes or not self._disk_files:
+                    return
+                path, size = self._disk_files.popitem(last=False)
+                self._disk_size -= size
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.png')
+    
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+        
+        if self.cache_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    with Image.open(path) as stored:
+                        image = stored.copy()
+                    self._remember(key, image)
+                    with self._lock:
+                        self.disk_hits += 1
+                        if path in self._disk_files:
+                            self._disk_files.move_to_end(path)
+                    return image
+                except Exception as e:
+                    print(f"キャッシュ読み込みエラー: {e}")
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key, image):
+        self._remember(key, image)
+        if self.cache_dir:
+            self._store(key, image)
+    
+    def _remember(self, key, image):
+        size = self._image_bytes(image)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self._image_bytes(old)
+            self._entries[key] = image
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._image_bytes(evicted)
+    
+    def _store(self, key, image):
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            buffer = BytesIO()
+            image.save(buffer, format='PNG')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 書き込み途中のファイルを読まないよう一時ファイルから置き換える
+            fd, temp_path = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    temp_file.write(buffer.getvalue())
+                os.replace(temp_path, path)
+                with self._lock:
+                    self._disk_size += buffer.tell() - self._disk_files.pop(path, 0)
+                    self._disk_files[path] = buffer.tell()
+                self._evict_disk()
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+        except Exception as e:
+            print(f"キャッシュ保存エラー: {e}")
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'disk_bytes': self._disk_size,
+            }
+    
+    def clear(self, disk=False):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if disk and self.cache_dir:
+            with self._lock:
+                self._disk_files.clear()
+                self._disk_size = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith('.png'):
+                        try:
+                            os.unlink(os.path.join(root, name))
+                        except OSError:
+                            pass
@@ -0,0 +1,147 @@
+import itertools
+import threading
+from io import BytesIO
+from PIL import Image
+from core.font_registry import label_fonts
+
+# 生成する画像の画素形式: 'RGB' (従来どおり) / 'L' (グレースケール) / '1' (白黒の1ビット)
+IMAGE_MODES = ('RGB', 'L', '1')
+# これ未満の明るさを黒とする
+BILEVEL_THRESHOLD = 128
+
+
+def check_image_mode(mode):
+    if mode not in IMAGE_MODES:
+        raise ValueError(f"不明な画素形式: {mode}")
+    return mode
+
+
+def to_bilevel(img, threshold=BILEVEL_THRESHOLD):
+    '''閾値で白黒の1ビット画像に変換（ディザリングしない）'''
+    if img.mode == '1':
+        return img
+    lut = [0 if value < threshold else 255 for value in range(256)]
+    return img.convert('L').point(lut, '1')
+
+
+def to_image_mode(img, mode):
+    '''画像を指定の画素形式にする（同じ形式ならそのまま、1ビットへは閾値で変換）'''
+    if img.mode == mode:
+        return img
+    if mode == '1':
+        return to_bilevel(img)
+    return img.convert(mode)
+
+
+def generate_batch(render, records, pipeline=None):
+    '''
+    records の各要素を render で生成し、結果を入力順に返すジェネレータ（取り出した分だけ生成する）
+    pipeline (RenderPipeline / SharedMemoryRenderPipeline) を渡すとワーカーで先行して生成する
+    '''
+    if pipeline is None:
+        for record in records:
+            yield render(record)
+        return
+    for _, result in pipeline.map(render, records):
+        yield result
+
+
+class GenerationBatch:
+    '''
+    generate_many 1回分の生成処理
+    レコード (値, 表示テキスト, サイズ) を generate で1件ずつ生成し、transform(画像, サイズ) があれば続けて適用する
+    フォントはバッチ内で共有し、ImageWriterや作業用バッファはスレッドごとに使い回す
+    （プロセス間で受け渡せるよう関数ではなくクラスにしている。共有中の資源は引き継がない）
+    '''
+
+    font_registry = label_fonts
+
+    def __init__(self, generator, transform=None):
+        self.generator = generator
+        self.transform = transform
+        self._fonts = {}
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {'generator': self.generator, 'transform': self.transform}
+
+    def __setstate__(self, state):
+        self.__init__(state['generator'], state['transform'])
+
+    def font(self, size):
+        '''指定サイズのフォント（バッチ内で1回だけ解決する）'''
+        font = self._fonts.get(size)
+        if font is None:
+            font = self._fonts.setdefault(size, self.font_registry.get_font(size))
+        return font
+
+    def scratch(self, name, factory):
+        '''スレッドごとの作業用オブジェクト（初回のみ factory() で作る）'''
+        value = getattr(self._local, name, None)
+        if value is None:
+            value = factory()
+            setattr(self._local, name, value)
+        return value
+
+    def generate(self, value, display_text, size):
+        raise NotImplementedError
+
+    def __call__(self, record):
+        value, display_text, size = record
+        img = self.generate(value, display_text, size)
+        if img is not None and self.transform is not None:
+            img = self.transform(img, size)
+        return img
+
+
+def prepare_code_image(code_img, width, height, scale_factor=2):
+    '''
+    配置サイズの縦横比で scale_factor 倍の解像度に揃える
+    幅が足りている画像はその幅のまま縦横比だけ揃え、縦横比も同じならそのまま返す
+    '''
+    high_res_size = (int(width * scale_factor), int(height * scale_factor))
+    if code_img.width >= high_res_size[0]:
+        high_res_size = (code_img.width, int(round(code_img.width * height / width)))
+        if abs(code_img.height - high_res_size[1]) <= 1:
+            # プリンタDPIで描画済みの画像はリサンプリングしない
+            return code_img
+    # 1ビット画像は補間せずに拡大する（白黒の境界をぼかさない）
+    resample = Image.Resampling.NEAREST if code_img.mode == '1' else Image.Resampling.LANCZOS
+    return code_img.resize(high_res_size, resample)
+
+
+class EmbedTransform:
+    '''
+    generate_many の transform: 生成した画像を配置サイズ (幅, 高さ) に対する埋め込み用の画像に揃える
+    encoder (CodeImageEncoder) を指定すると、その解像度倍率・画素形式に揃える
+    '''
+
+    def __init__(self, encoder=None):
+        self.encoder = encoder
+
+    def __call__(self, img, size):
+        width, height = size
+        if self.encoder is not None:
+            return self.encoder.prepare(img, width, height)
+        return prepare_code_image(img, width, height)
+
+
+def render_placements(generator, jobs, pipeline=None, encoder=None, vector=False):
+    '''
+    配置 (data, placement) の列に対して、埋め込み用のコード画像を (job, 画像) として投入順に返す
+    画像は generator.generate_many でまとめて生成する（ベクター描画する場合は作らず None）
+    '''
+    if vector:
+        return ((job, None) for job in jobs)
+
+    jobs, placed = itertools.tee(jobs)
+    records = ((data['barcode'], data['name'], (placement.width, placement.height))
+               for data, placement in placed)
+    return zip(jobs, generator.generate_many(records, pipeline, EmbedTransform(encoder)))
+
+
+def encode_png(img):
+    '''PNGバイト列に変換'''
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
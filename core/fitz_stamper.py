@@ -0,0 +1,201 @@
+import os
+import fitz
+from core.code128_vector import Code128VectorRenderer
+from core.qr_vector import QRVectorRenderer
+from core.code_image import render_placements
+from core.image_encoding import CodeImageEncoder
+from core.render_pipeline import RenderPipeline
+from core.placement import PlacementPlan
+from core.pdf_compaction import DEFAULT_SAVE_OPTIONS, compaction_options
+from core.xobject_pool import ImageXObjectPool
+from core.streaming_output import StreamingPdfOutput
+
+
+class FitzStamper:
+    '''PyMuPDFでテンプレートのページに直接コードを書き込み、最後に1回だけ保存する'''
+    
+    def __init__(self, code_renderer='raster', template_mode='copy', chunk_pages=None, memory_limit_mb=None,
+                 pipeline=None, compaction=None, encoder=None):
+        '''
+        template_mode: 'copy' (レコードごとにテンプレートのページを複製する)
+                       'xobject' (テンプレートの各ページを1回だけForm XObjectとして埋め込み参照する
+                                  注釈・フォームフィールドは引き継がれないため指定した場合のみ使う)
+        chunk_pages / memory_limit_mb: 連続印刷モードで出力を逐次ディスクへ書き出す条件
+        pipeline: コード画像を先行生成する RenderPipeline（省略時は順番に生成）
+        compaction: 出力PDFの圧縮プリセット（pdf_compaction.COMPACTION_PRESETS）
+        encoder: コード画像の埋め込み方式 CodeImageEncoder（省略時は従来どおりRGBで埋め込む）
+        '''
+        self.code_renderer = code_renderer
+        self.template_mode = template_mode
+        self.chunk_pages = chunk_pages
+        self.memory_limit_mb = memory_limit_mb
+        self.pipeline = pipeline or RenderPipeline()
+        self.save_options = compaction_options(compaction)
+        self.encoder = encoder or CodeImageEncoder()
+        self.stats = {}
+        self.image_pool = ImageXObjectPool()
+        self._vector_renderer = None
+        self._qr_vector_renderer = None
+    
+    def _insert_code(self, page, data, placement, is_qrcode, code_img):
+        '''1つの配置位置にコードを書き込む（PyMuPDFは左上原点）'''
+        rect = fitz.Rect(placement.rect)
+        
+        if self.code_renderer == 'vector':
+            renderer = self._get_vector_renderer(is_qrcode)
+            renderer.draw_on_page(page, data['barcode'], data['name'], rect)
+            return
+        
+        if code_img:
+            self.image_pool.insert_on_page(
+                page, self.encoder.prepare(code_img, placement.width, placement.height), rect,
+                self.encoder.insert_image
+            )
+    
+    def _get_vector_renderer(self, is_qrcode):
+        if is_qrcode:
+            if self._qr_vector_renderer is None:
+                self._qr_vector_renderer = QRVectorRenderer()
+            return self._qr_vector_renderer
+        if self._vector_renderer is None:
+            self._vector_renderer = Code128VectorRenderer()
+        return self._vector_renderer
+    
+    def _rendered(self, jobs, generator, is_qrcode):
+        '''(data, placement) の列に対して生成済みのコード画像を投入順に返す'''
+        return render_placements(generator, jobs, self.pipeline, self.encoder,
+                                 self.code_renderer == 'vector')
+    
+    def _new_template_page(self, output, template, page_num):
+        '''
+        テンプレートのページをForm XObjectとして参照する新しいページを追加
+        PyMuPDFは同じ元ページのXObjectを再利用するため、テンプレートの内容は1回だけ埋め込まれる
+        （注釈・フォームフィールドは引き継がれない）
+        内容のない白紙ページはXObjectにできないため、そのページだけ複製する
+        '''
+        if not template[page_num].get_contents():
+            output.insert_pdf(template, from_page=page_num, to_page=page_num)
+            return output[-1]
+        
+        src_rect = template[page_num].rect
+        page = output.new_page(width=src_rect.width, height=src_rect.height)
+        page.show_pdf_page(page.rect, template, page_num)
+        return page
+    
+    def _save(self, output, input_pdf, output_pdf):
+        if os.path.abspath(input_pdf) == os.path.abspath(output_pdf):
+            # 開いているファイルへは直接保存できないため一旦メモリに書き出す
+            data = output.tobytes(**(self.save_options or DEFAULT_SAVE_OPTIONS))
+            output.close()
+            with open(output_pdf, 'wb') as output_file:
+                output_file.write(data)
+        else:
+            output.save(output_pdf, **(self.save_options or DEFAULT_SAVE_OPTIONS))
+    
+    def add_codes_continuous(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode=False):
+        '''連続印刷モード'''
+        template = fitz.open(input_pdf)
+        output = StreamingPdfOutput(output_pdf, self.chunk_pages, self.memory_limit_mb, self.save_options)
+        try:
+            page_count = len(template)
+            plan = PlacementPlan.for_document(positions, size_dict, template)
+            rendered = self._rendered(
+                ((data, placement) for data in data_list for placement in plan),
+                generator, is_qrcode
+            )
+            
+            for data in data_list:
+                doc = output.doc
+                start = len(doc)
+                if self.template_mode == 'copy':
+                    doc.insert_pdf(template)
+                
+                for page_num in range(page_count):
+                    if self.template_mode == 'copy':
+                        page = doc[start + page_num]
+                    else:
+                        page = self._new_template_page(doc, template, page_num)
+                    
+                    for placement in plan.on_page(page_num):
+                        _, code_img = next(rendered)
+                        self._insert_code(page, data, placement, is_qrcode, code_img)
+                
+                # レコード単位で書き出し判定（ページオブジェクトを持ち越さない）
+                output.pages_added(page_count)
+            
+            output.finish()
+            self.stats = output.stats()
+        except Exception:
+            output.abort()
+            raise
+        finally:
+            template.close()
+    
+    def add_codes_paginated(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode=False):
+        '''
+        一括配置モード（ページ送りあり）
+        レコードを全ページの配置位置に順番に割り当て、足りなければテンプレート一式を複製して続ける
+        '''
+        template = fitz.open(input_pdf)
+        output = StreamingPdfOutput(output_pdf, self.chunk_pages, self.memory_limit_mb, self.save_options)
+        try:
+            page_count = len(template)
+            placements = list(PlacementPlan.for_document(positions, size_dict, template))
+            capacity = len(placements)
+            if capacity == 0:
+                raise ValueError("配置位置がありません")
+            
+            rendered = self._rendered(
+                ((data, placements[i % capacity]) for i, data in enumerate(data_list)),
+                generator, is_qrcode
+            )
+            
+            # レコードが0件でもテンプレート1枚分は出力する
+            for start in range(0, max(len(data_list), 1), capacity):
+                doc = output.doc
+                first = len(doc)
+                if self.template_mode == 'copy':
+                    doc.insert_pdf(template)
+                else:
+                    for page_num in range(page_count):
+                        self._new_template_page(doc, template, page_num)
+                # ページを追加すると既存のPageオブジェクトは無効になるため、追加し終えてから取得する
+                pages = [doc[first + page_num] for page_num in range(page_count)]
+                
+                for placement, data in zip(placements, data_list[start:start + capacity]):
+                    _, code_img = next(rendered)
+                    self._insert_code(pages[placement.page], data, placement, is_qrcode, code_img)
+                
+                # 1枚分ごとに書き出し判定（ページオブジェクトを持ち越さない）
+                pages = None
+                output.pages_added(page_count)
+            
+            output.finish()
+            self.stats = output.stats()
+        except Exception:
+            output.abort()
+            raise
+        finally:
+            template.close()
+    
+    def add_codes_batch(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode=False):
+        '''一括配置モード'''
+        output = fitz.open(input_pdf)
+        try:
+            plan = PlacementPlan.for_document(positions, size_dict, output)
+            rendered = self._rendered(
+                ((data, placement) for placements in plan.pages for placement, data in zip(placements, data_list)),
+                generator, is_qrcode
+            )
+            
+            for page_num, placements in enumerate(plan.pages):
+                if placements and data_list:
+                    page = output[page_num]
+                    for placement, data in zip(placements, data_list):
+                        _, code_img = next(rendered)
+                        self._insert_code(page, data, placement, is_qrcode, code_img)
+            
+            self._save(output, input_pdf, output_pdf)
+        finally:
+            if not output.is_closed:
+                output.close()
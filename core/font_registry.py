@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+
+# ラベル用（日本語表示名を含む）
+LABEL_FONT_PATHS = [
+    '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',
+    '/System/Library/Fonts/ヒラギノ角ゴシック W6.ttc',
+    '/System/Library/Fonts/Hiragino Sans GB.ttc',
+    '/Library/Fonts/Arial Unicode.ttf',
+    '/System/Library/Fonts/Supplemental/Arial Unicode.ttf',
+    'C:/Windows/Fonts/meiryo.ttc',
+    'C:/Windows/Fonts/msgothic.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc',
+    '/System/Library/Fonts/Supplemental/Arial.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    'arial.ttf',
+]
+
+# コード番号・ヘッダー用
+LATIN_FONT_PATHS = [
+    '/System/Library/Fonts/Helvetica.ttc',
+    '/System/Library/Fonts/HelveticaNeue.ttc',
+    '/Library/Fonts/Arial.ttf',
+    '/System/Library/Fonts/Supplemental/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+]
+
+
+class FontRegistry:
+    '''フォントファイルを一度だけ解決し、読み込んだフォントをサイズごとにLRUで保持する'''
+    
+    def __init__(self, font_paths, max_sizes=32):
+        self.font_paths = list(font_paths)
+        self.max_sizes = max_sizes
+        self._font_path = None
+        self._resolved = False
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _resolve(self):
+        for font_path in self.font_paths:
+            # 相対名（arial.ttf など）はPillowのフォント検索に任せる
+            if os.path.isabs(font_path) and not os.path.exists(font_path):
+                continue
+            try:
+                ImageFont.truetype(font_path, 12)
+                return font_path
+            except Exception:
+                continue
+        return None
+    
+    def get_font_path(self):
+        with self._lock:
+            if not self._resolved:
+                self._font_path = self._resolve()
+                self._resolved = True
+            return self._font_path
+    
+    def get_font(self, size):
+        size = max(1, int(size))
+        font_path = self.get_font_path()
+        
+        with self._lock:
+            font = self._fonts.get(size)
+            if font is not None:
+                self._fonts.move_to_end(size)
+                return font
+        
+        font = None
+        if font_path:
+            try:
+                font = ImageFont.truetype(font_path, size)
+            except Exception:
+                font = None
+        if font is None:
+            font = ImageFont.load_default()
+        
+        with self._lock:
+            self._fonts[size] = font
+            while len(self._fonts) > self.max_sizes:
+                self._fonts.popitem(last=False)
+        return font
+
+
+# プロセス全体で共有するレジストリ
+label_fonts = FontRegistry(LABEL_FONT_PATHS)
+latin_fonts = FontRegistry(LATIN_FONT_PATHS)
@@ -0,0 +1,197 @@
+import hashlib
+import zlib
+from io import BytesIO
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFImageXObject, PDFStream, PDFName, PDFArray, PDFDictionary
+from reportlab.pdfgen.canvas import _digester
+from core.code_image import prepare_code_image, encode_png, to_bilevel, BILEVEL_THRESHOLD
+
+# コード画像の埋め込み方式のプリセット
+# bilevel: 1ビット（白黒）に変換する
+# codecs: 1ビット画像の圧縮方式 'flate' / 'g4' (CCITT Group 4)。複数指定すると小さい方を使う
+# level: Flateの圧縮レベル
+ENCODING_PRESETS = {
+    'rgb': {'bilevel': False, 'codecs': (), 'level': 6},
+    'fast': {'bilevel': True, 'codecs': ('flate',), 'level': 1},
+    'balanced': {'bilevel': True, 'codecs': ('flate',), 'level': 6},
+    'smallest': {'bilevel': True, 'codecs': ('flate', 'g4'), 'level': 9},
+}
+
+# 配置サイズに対する埋め込み解像度の倍率
+DEFAULT_SCALE_FACTOR = 2
+
+
+def encode_flate(img, level=6):
+    '''1ビット画像をFlateで圧縮（1行ごとにバイト境界で詰めた形式、1=白）'''
+    return zlib.compress(img.tobytes(), level)
+
+
+def encode_g4(img):
+    '''
+    1ビット画像をCCITT Group 4で圧縮
+    PillowのTIFF出力から1つのストリップだけを取り出し、(データ, 白黒を反転して読むか) を返す
+    '''
+    buffer = BytesIO()
+    img.save(buffer, format='TIFF', compression='group4',
+             strip_size=(img.width + 7) // 8 * img.height)
+    buffer.seek(0)
+    tiff = Image.open(buffer)
+    offset = tiff.tag_v2[273][0]
+    length = tiff.tag_v2[279][0]
+    # PhotometricInterpretation 1 (BlackIsZero) で書き出された場合は符号の白黒が逆になる
+    inverted = tiff.tag_v2.get(262, 0) == 1
+    return buffer.getvalue()[offset:offset + length], inverted
+
+
+class EncodedImage:
+    '''符号化済みの1ビット画像（PDFの画像XObjectにそのまま書き込める形）'''
+    
+    def __init__(self, width, height, data, filter_name, decode_parms=None, inverted=False):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.filter_name = filter_name
+        self.decode_parms = decode_parms
+        # Trueなら /Decode [1 0] で白黒を反転して表示する
+        self.inverted = inverted
+    
+    def pdf_dict(self):
+        '''画像XObjectの辞書（ストリーム以外）をPDFの文字列で返す'''
+        entries = [f"/Type/XObject/Subtype/Image/Width {self.width}/Height {self.height}",
+                   "/ColorSpace/DeviceGray/BitsPerComponent 1"]
+        if self.inverted:
+            entries.append("/Decode[1 0]")
+        return "<<" + "".join(entries) + ">>"
+    
+    def pdf_decode_parms(self):
+        if not self.decode_parms:
+            return None
+        return "<<" + "".join(f"/{key} {value}" for key, value in self.decode_parms.items()) + ">>"
+
+
+class BilevelImageXObject(PDFImageXObject):
+    '''符号化済みの1ビット画像をreportlabで再圧縮せずに書き出す画像XObject'''
+    
+    def __init__(self, name, encoded):
+        PDFImageXObject.__init__(self, name)
+        self.encoded = encoded
+        self.width = encoded.width
+        self.height = encoded.height
+    
+    def format(self, document):
+        encoded = self.encoded
+        stream = PDFStream(content=encoded.data)
+        entries = stream.dictionary
+        entries['Type'] = PDFName('XObject')
+        entries['Subtype'] = PDFName('Image')
+        entries['Width'] = encoded.width
+        entries['Height'] = encoded.height
+        entries['BitsPerComponent'] = 1
+        entries['ColorSpace'] = PDFName('DeviceGray')
+        if encoded.inverted:
+            entries['Decode'] = PDFArray([1, 0])
+        # Filterを設定しておくとreportlabはストリームを圧縮し直さない
+        entries['Filter'] = PDFName(encoded.filter_name)
+        if encoded.decode_parms:
+            entries['DecodeParms'] = PDFDictionary(dict(encoded.decode_parms))
+        entries['Length'] = len(encoded.data)
+        return stream.format(document)
+
+
+class CodeImageEncoder:
+    '''
+    コード画像を埋め込み用の解像度・画素形式に揃え、PDFへ埋め込む
+    白黒のコードは1ビットにしてFlateまたはCCITT Group 4で圧縮し、そのまま画像XObjectにする
+    '''
+    
+    def __init__(self, preset='rgb', scale_factor=DEFAULT_SCALE_FACTOR, threshold=BILEVEL_THRESHOLD):
+        '''
+        preset: ENCODING_PRESETS のキー
+                'rgb' (従来どおりRGBのまま) / 'fast' / 'balanced' (1ビットFlate) /
+                'smallest' (1ビットFlateとCCITT G4の小さい方)
+        scale_factor: 配置サイズに対する埋め込み解像度の倍率
+        threshold: 白黒に変換する際の閾値
+        '''
+        if preset not in ENCODING_PRESETS:
+            raise ValueError(f"不明な埋め込みプリセット: {preset}")
+        self.preset = preset
+        self.scale_factor = scale_factor
+        self.threshold = threshold
+        self.options = ENCODING_PRESETS[preset]
+    
+    @property
+    def bilevel(self):
+        return self.options['bilevel']
+    
+    def prepare(self, img, width=None, height=None):
+        '''
+        埋め込み用の画像に揃える（配置サイズ指定時は scale_factor 倍の解像度にする）
+        すでに揃っている画像はそのまま返す
+        '''
+        if width is not None and height is not None:
+            img = prepare_code_image(img, width, height, self.scale_factor)
+        if self.bilevel:
+            img = to_bilevel(img, self.threshold)
+        return img
+    
+    def encode(self, img):
+        '''1ビット画像をプリセットの方式で符号化する（複数の方式があれば最小のもの）'''
+        img = to_bilevel(img, self.threshold)
+        best = None
+        for codec in self.options['codecs']:
+            if codec == 'g4':
+                data, inverted = encode_g4(img)
+                candidate = EncodedImage(img.width, img.height, data, 'CCITTFaxDecode',
+                                         {'K': -1, 'Columns': img.width, 'Rows': img.height}, inverted)
+            else:
+                candidate = EncodedImage(img.width, img.height,
+                                         encode_flate(img, self.options['level']), 'FlateDecode')
+            if best is None or len(candidate.data) < len(best.data):
+                best = candidate
+        return best
+    
+    def draw_on_canvas(self, can, img, x, y, width, height, key=None, **kwargs):
+        '''
+        reportlabキャンバスに描画
+        1ビットの場合は符号化済みの画像XObjectを登録し、同じ key（省略時は内容のハッシュ）なら再利用する
+        '''
+        if not self.bilevel:
+            can.drawImage(ImageReader(img), x, y, width=width, height=height, **kwargs)
+            return
+        
+        img = to_bilevel(img, self.threshold)
+        if key is None:
+            key = hashlib.sha1(img.tobytes()).hexdigest()
+        # 白黒画像にはマスクを使わない
+        kwargs.pop('mask', None)
+        source = f"bilevel:{self.preset}:{img.width}x{img.height}:{key}"
+        # drawImage がファイル名に対して付ける名前で登録しておくと、ファイルを開かずに参照される
+        name = _digester(f"{source}None".encode('utf-8'))
+        reg_name = can._doc.getXObjectName(name)
+        if can._doc.idToObject.get(reg_name) is None:
+            xobject = BilevelImageXObject(name, self.encode(img))
+            can._doc.Reference(xobject, reg_name)
+            can._doc.addForm(name, xobject)
+        can.drawImage(source, x, y, width=width, height=height, **kwargs)
+    
+    def insert_image(self, page, img, rect):
+        '''PyMuPDFのページに画像を埋め込み、画像のxrefを返す'''
+        if not self.bilevel:
+            return page.insert_image(rect, stream=encode_png(img), keep_proportion=True)
+        
+        xref = self._add_encoded_image(page.parent, self.encode(img))
+        page.insert_image(rect, xref=xref, keep_proportion=True)
+        return xref
+    
+    def _add_encoded_image(self, doc, encoded):
+        '''符号化済みのデータをそのまま画像XObjectとして追加（PyMuPDFによる再圧縮を避ける）'''
+        xref = doc.get_new_xref()
+        doc.update_object(xref, encoded.pdf_dict())
+        doc.update_stream(xref, encoded.data, compress=False)
+        # update_stream は Filter を外すため、書き込んだ後に設定する
+        doc.xref_set_key(xref, 'Filter', f"/{encoded.filter_name}")
+        decode_parms = encoded.pdf_decode_parms()
+        if decode_parms:
+            doc.xref_set_key(xref, 'DecodeParms', decode_parms)
+        return xref
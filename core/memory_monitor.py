@@ -0,0 +1,68 @@
+import os
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _windows_memory_info():
+    '''Windowsの (WorkingSetSize, PeakWorkingSetSize) を返す'''
+    import ctypes
+    from ctypes import wintypes
+    
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+    
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+    return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+
+def current_rss_bytes():
+    '''現在の常駐メモリ量（バイト）'''
+    try:
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        if sys.platform == 'win32':
+            return _windows_memory_info()[0]
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        # 取得できない環境ではピーク値で代用する
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    '''プロセス開始以降の最大常駐メモリ量（バイト）'''
+    try:
+        if sys.platform == 'win32':
+            return _windows_memory_info()[1]
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOSはバイト、Linuxはキロバイト単位
+            return peak if sys.platform == 'darwin' else peak * 1024
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    return 0
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+
+class PageImageCache:
+    '''
+    プレビュー用にラスタライズしたページ画像（PyMuPDFのPixmap）のキャッシュ
+    キーは (ページ番号, 倍率, 切り出し範囲)、画素のバイト数上限つきLRUで古いものから破棄する
+    返す画像は共有されるため、呼び出し側で書き換えないこと
+    '''
+    
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _image_bytes(pixmap):
+        return pixmap.stride * pixmap.height
+    
+    def get(self, page_num, zoom, clip=None):
+        key = (page_num, zoom, clip)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+    
+    def put(self, page_num, zoom, image, clip=None):
+        size = self._image_bytes(image)
+        if size > self.max_bytes:
+            return
+        key = (page_num, zoom, clip)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self._image_bytes(old)
+            self._entries[key] = image
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._image_bytes(evicted)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,68 @@
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+from core.streaming_output import StreamingPdfOutput
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def split_shards(items, workers, shards_per_worker=4):
+    '''
+    items を連続した範囲に分割し (開始位置, 部分リスト) のリストを返す
+    負荷の偏りを抑えるためワーカー数より多めに分割する
+    '''
+    if not items:
+        return []
+    shard_count = max(1, min(len(items), workers * shards_per_worker))
+    shard_size = math.ceil(len(items) / shard_count)
+    return [(start, items[start:start + shard_size]) for start in range(0, len(items), shard_size)]
+
+
+def concatenate_pdfs(part_paths, output_pdf, chunk_pages=None, save_options=None):
+    '''
+    部分PDFを順番どおりに連結する
+    オブジェクトをそのままコピーするため、ページ内容の再解析は行わない
+    '''
+    output = StreamingPdfOutput(output_pdf, chunk_pages, save_options=save_options)
+    try:
+        for part_path in part_paths:
+            part = fitz.open(part_path)
+            try:
+                output.doc.insert_pdf(part)
+                output.pages_added(len(part))
+            finally:
+                part.close()
+        output.finish()
+    except Exception:
+        output.abort()
+        raise
+    return output.stats()
+
+
+def run_sharded(worker, output_pdf, shards, make_task, workers, chunk_pages=None, save_options=None):
+    '''
+    各シャードを別プロセスで部分PDFに書き出し、順番どおりに連結する
+    worker(task) は部分PDFを書き出すトップレベル関数
+    make_task(part_path, start, shard) はworkerに渡す引数を作る
+    save_options: 連結後の保存オプション（pdf_compaction）
+    '''
+    temp_dir = tempfile.mkdtemp(prefix='barcode_parts_',
+                                dir=os.path.dirname(os.path.abspath(output_pdf)))
+    try:
+        part_paths = [os.path.join(temp_dir, f'part_{i:05d}.pdf') for i in range(len(shards))]
+        tasks = [make_task(part_path, start, shard)
+                 for part_path, (start, shard) in zip(part_paths, shards)]
+        
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            # mapは投入順に結果を返すため、失敗したシャードはここで例外になる
+            for _ in executor.map(worker, tasks):
+                pass
+        
+        return concatenate_pdfs(part_paths, output_pdf, chunk_pages, save_options)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
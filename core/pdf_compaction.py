@@ -0,0 +1,71 @@
+import inspect
+import os
+import tempfile
+import fitz
+
+# 出力PDFの圧縮プリセット（PyMuPDFの保存オプション）
+# garbage: 1=未使用オブジェクトの削除 3=重複オブジェクトの統合 4=重複ストリームの統合
+# use_objstms: オブジェクトをオブジェクトストリームにまとめて圧縮する（PyMuPDF 1.24以降）
+COMPACTION_PRESETS = {
+    'none': None,
+    'fast': {'garbage': 1, 'deflate': True},
+    'balanced': {'garbage': 3, 'deflate': True, 'use_objstms': 1},
+    'smallest': {'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True,
+                 'clean': True, 'use_objstms': 1},
+}
+
+# プリセット未指定時にPyMuPDFで保存する場合の既定
+DEFAULT_SAVE_OPTIONS = {'garbage': 3, 'deflate': True}
+
+
+def _supported_save_options():
+    try:
+        return set(inspect.signature(fitz.Document.save).parameters)
+    except (TypeError, ValueError):
+        return None
+
+
+# インストールされているPyMuPDFの Document.save が受け付けるオプション
+SUPPORTED_SAVE_OPTIONS = _supported_save_options()
+
+
+def compaction_options(preset):
+    '''
+    プリセット名から保存オプションを返す（'none' や None なら None）
+    インストールされているPyMuPDFが対応していないオプションは除く
+    '''
+    if not preset:
+        return None
+    if preset not in COMPACTION_PRESETS:
+        raise ValueError(f"不明な圧縮プリセット: {preset}")
+    options = COMPACTION_PRESETS[preset]
+    if options and SUPPORTED_SAVE_OPTIONS is not None:
+        options = {key: value for key, value in options.items() if key in SUPPORTED_SAVE_OPTIONS}
+    return options
+
+
+def compact_pdf(path, preset='balanced'):
+    '''
+    保存済みのPDFをプリセットの設定で保存し直し、元のファイルを置き換える
+    圧縮前後のファイルサイズを返す（圧縮しない場合は None）
+    '''
+    options = compaction_options(preset) if isinstance(preset, str) else preset
+    if not options:
+        return None
+    
+    before = os.path.getsize(path)
+    fd, temp_path = tempfile.mkstemp(suffix='.pdf', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        doc = fitz.open(path)
+        try:
+            doc.save(temp_path, **options)
+        finally:
+            doc.close()
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    
+    return before, os.path.getsize(path)
@@ -1,126 +1,353 @@
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfReader, PdfWriter, PageObject, Transformation
+from PyPDF2.generic import NameObject
 from reportlab.pdfgen import canvas
 from io import BytesIO
 from PIL import Image
+import threading
 import fitz
-import tempfile
-import os
+from core.code128_vector import Code128VectorRenderer
+from core.qr_vector import QRVectorRenderer
+from core.code_image import render_placements
+from core.image_encoding import CodeImageEncoder, DEFAULT_SCALE_FACTOR
+from core.fitz_stamper import FitzStamper
+from core.page_cache import PageImageCache
+from core.placement import PlacementPlan
+from core.pdf_compaction import compaction_options, compact_pdf
+from core.parallel import split_shards, run_sharded
+from core.render_pipeline import RenderPipeline
+from core.shared_image_transport import SharedMemoryRenderPipeline
+
+# これ未満のレコード数ではプロセス起動のコストが上回るため並列化しない
+PARALLEL_MIN_RECORDS = 50
 
 class PDFHandler:
-    def __init__(self):
+    def __init__(self, code_renderer='raster', engine='pypdf2', template_mode='copy',
+                 stream_output=False, stream_chunk_pages=200, memory_limit_mb=None, workers=1,
+                 render_workers=1, render_queue_size=None, render_backend='thread',
+                 page_cache_mb=256, compaction='none', image_encoding='rgb',
+                 image_scale=DEFAULT_SCALE_FACTOR):
+        '''
+        code_renderer: 'raster' (画像として貼り付け) または
+                       'vector' (バーコード・QRコードを矩形とテキストで直接描画)
+        engine: 'pypdf2' (ページごとにreportlabで作成して重ね合わせ) または
+                'fitz' (PyMuPDFでテンプレートへ直接書き込み、1回で保存)
+        template_mode: fitz使用時（連続印刷・ページ送りありの一括配置）のテンプレート埋め込み方法
+                       'copy' (レコードごとに複製) または
+                       'xobject' (各ページを1回だけ埋め込んで参照、注釈・フォームフィールドは引き継がれない)
+        stream_output: 連続印刷モードでページを逐次ディスクへ書き出す（fitzエンジンを使用）
+                       stream_chunk_pages ページごと、または常駐メモリが memory_limit_mb を
+                       超えた時点で書き出す
+        workers: 2以上で連続印刷モードをプロセス並列で実行（レコードを分割して部分PDFを連結）
+        render_workers: 2以上でコード画像の生成をスレッドプールで先行させ、1つの書き込み処理に順番に渡す
+                        render_queue_size は先行生成する最大件数（省略時は render_workers の2倍）
+        render_backend: 'thread' (スレッドで生成) または
+                        'process' (別プロセスで生成し、画素を共有メモリ経由でコピーせずに受け取る)
+        page_cache_mb: プレビュー用ページ画像のキャッシュ上限（MB）
+        compaction: 出力PDFの圧縮プリセット
+                    'none' / 'fast' / 'balanced' (オブジェクトストリーム) / 'smallest' (重複ストリームの統合など)
+        image_encoding: コード画像の埋め込み方式（image_encoding.ENCODING_PRESETS）
+                        'rgb' (従来どおり) / 'fast' / 'balanced' (1ビットFlate) / 'smallest' (CCITT G4も試す)
+                        1ビットの場合はどちらのエンジンでも符号化済みのデータをそのまま画像XObjectにする
+                        （reportlabでは BilevelImageXObject、PyMuPDFでは直接書き込んだストリーム）
+                        閾値で白黒にするため、小さな文字を含む画像は十分な解像度で生成すること
+        image_scale: 配置サイズに対するコード画像の解像度の倍率
+        '''
         self.pdf_document = None
         self.page_count = 0
+        self.code_renderer = code_renderer
+        self.engine = engine
+        self.template_mode = template_mode
+        self.stream_output = stream_output
+        self.stream_chunk_pages = stream_chunk_pages
+        self.memory_limit_mb = memory_limit_mb
+        self.workers = workers
+        self.render_workers = render_workers
+        self.render_queue_size = render_queue_size
+        self.render_backend = render_backend
+        self.page_cache = PageImageCache(page_cache_mb * 1024 * 1024)
+        self.compaction = compaction
+        self.image_encoding = image_encoding
+        self.image_scale = image_scale
+        self.encoder = CodeImageEncoder(image_encoding, image_scale)
+        # プレビューの描画は別に開いたDocumentで行い、描画中でも画面側の問い合わせを待たせない
+        # （fitzのDocumentはスレッドセーフではないため、描画どうしはロックで排他する）
+        self.page_sizes = []
+        self._render_document = None
+        self._render_lock = threading.RLock()
+        self.last_stats = {}
+        self._vector_renderer = None
+        self._qr_vector_renderer = None
     
     def load_pdf(self, pdf_path):
-        try:
-            self.pdf_document = fitz.open(pdf_path)
-            self.page_count = len(self.pdf_document)
-            return True
-        except Exception as e:
-            print(f"PDF読み込みエラー: {e}")
-            return False
+        # 描画中のページが終わるのを待ってから差し替える
+        with self._render_lock:
+            # 前のPDFのページ画像を返さないよう、読み込み前に破棄する
+            self.page_cache.clear()
+            try:
+                document = fitz.open(pdf_path)
+                render_document = fitz.open(pdf_path)
+                self.pdf_document = document
+                self.page_count = len(document)
+                # ページサイズは読み込み時に1回だけ取得する（画面側はDocumentに触れない）
+                self.page_sizes = [(page.rect.width, page.rect.height) for page in document]
+                self._render_document = render_document
+                return True
+            except Exception as e:
+                print(f"PDF読み込みエラー: {e}")
+                return False
     
     def get_page_count(self):
         return self.page_count
     
     def get_page_size(self, page_num):
-        if not self.pdf_document or page_num >= self.page_count:
-            return None
-        
-        try:
-            page = self.pdf_document[page_num]
-            rect = page.rect
-            return (rect.width, rect.height)
-        except Exception as e:
-            print(f"ページサイズ取得エラー: {e}")
+        if not 0 <= page_num < len(self.page_sizes):
             return None
+        return self.page_sizes[page_num]
+    
+    def compile_plan(self, positions, size_dict):
+        '''読み込み中のPDFのページサイズで配置計画を作る'''
+        return PlacementPlan(positions, size_dict, self.page_sizes)
+    
+    def get_cached_page_pixmap(self, page_num, zoom=2, clip=None):
+        '''描画済みならそのPixmap、未描画なら None（描画はしない）'''
+        return self.page_cache.get(page_num, zoom, clip)
     
-    def get_page_image(self, page_num):
-        if not self.pdf_document or page_num >= self.page_count:
+    def get_page_pixmap(self, page_num, zoom=2, clip=None):
+        '''
+        ページをラスタライズしたPyMuPDFのPixmap（同じページ・倍率・範囲はキャッシュから返す）
+        clip: (x0, y0, x1, y1) を指定するとページ座標のその範囲だけを描画する
+        返すPixmapはキャッシュと共有されるため書き換えないこと
+        '''
+        if not self._render_document or page_num >= self.page_count:
             return None
         
+        pix = self.page_cache.get(page_num, zoom, clip)
+        if pix is not None:
+            return pix
+        
         try:
-            page = self.pdf_document[page_num]
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            return img
+            with self._render_lock:
+                # 待っている間に別スレッドが描画済みにしたか、別のPDFが読み込まれた場合
+                pix = self.page_cache.get(page_num, zoom, clip)
+                if pix is not None or page_num >= self.page_count:
+                    return pix
+                page = self._render_document[page_num]
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom),
+                                      clip=fitz.Rect(clip) if clip else None)
+                self.page_cache.put(page_num, zoom, pix, clip)
+            return pix
         except Exception as e:
             print(f"ページ画像取得エラー: {e}")
             return None
     
+    def get_page_image(self, page_num, zoom=2, clip=None):
+        '''ページをラスタライズしたPIL画像'''
+        pix = self.get_page_pixmap(page_num, zoom, clip)
+        if pix is None:
+            return None
+        # pix.samples は bytes へのコピーを作るため、memoryview から1回だけコピーする
+        return Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1)
+    
     def _add_code_to_canvas(self, can, code_img, x, y, width, height):
         '''超高品質でコードをキャンバスに追加'''
-        scale_factor = 2
-        high_res_img = code_img.resize(
-            (int(width * scale_factor), int(height * scale_factor)), 
-            Image.Resampling.LANCZOS
-        )
+        high_res_img = self.encoder.prepare(code_img, width, height)
         
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-            temp_path = temp_file.name
-            high_res_img.save(temp_path, format='PNG', optimize=False, compress_level=0, dpi=(300, 300))
+        # 一時ファイルを介さずメモリ上の画像をそのまま渡す
+        self.encoder.draw_on_canvas(can, high_res_img, x, y, 
+                                    width=width, height=height, 
+                                    mask='auto', preserveAspectRatio=True)
+    
+    def _draw_code(self, can, data, placement, is_qrcode, code_img):
+        '''1つの配置位置にコードを描画'''
+        if self.code_renderer == 'vector':
+            renderer = self._get_vector_renderer(is_qrcode)
+            renderer.draw(can, data['barcode'], data['name'],
+                          placement.pdf_x, placement.pdf_y,
+                          placement.width, placement.height)
+            return
         
+        if code_img:
+            self._add_code_to_canvas(can, code_img, placement.pdf_x, placement.pdf_y, 
+                                   placement.width, placement.height)
+    
+    def _draw_overlays(self, overlay_pages, is_qrcode, rendered):
+        '''
+        重ね合わせ用のページを1つのreportlab文書にまとめて描画し、PdfReaderで返す
+        overlay_pages: (ページサイズ, [(data, placement), ...]) の列（1要素が重ね合わせ1ページ）
+        reportlabは同じ内容の画像を文書内で1回だけ埋め込み、PdfWriterも同じReaderのオブジェクトは
+        1回だけ取り込むため、同じコード画像は出力全体で1つの画像XObjectを共有する
+        '''
+        packet = BytesIO()
+        can = canvas.Canvas(packet)
+        for page_size, items in overlay_pages:
+            can.setPageSize(page_size)
+            for data, placement in items:
+                _, code_img = next(rendered)
+                self._draw_code(can, data, placement, is_qrcode, code_img)
+            can.showPage()
+        can.save()
+        packet.seek(0)
+        return PdfReader(packet)
+    
+    @staticmethod
+    def _align_overlay(overlay, page):
+        '''重ね合わせページ（原点 (0, 0) で描画）を page のmediaboxの原点に合わせて移動する'''
+        x0, y0 = float(page.mediabox.left), float(page.mediabox.bottom)
+        if x0 or y0:
+            overlay.add_transformation(Transformation().translate(x0, y0))
+        return overlay
+    
+    def _overlay_page(self, original_page, overlay):
+        '''
+        元ページと重ね合わせページを合成した新しいページを返す（元ページは変更しない）
+        mediabox・cropbox・回転は元ページに合わせる
+        '''
+        mediabox = original_page.mediabox
+        page = PageObject.create_blank_page(width=float(mediabox.width), height=float(mediabox.height))
+        page.merge_page(original_page)
+        page.merge_page(self._align_overlay(overlay, original_page))
+        page.mediabox = mediabox
+        page.cropbox = original_page.cropbox
+        if '/Rotate' in original_page:
+            page[NameObject('/Rotate')] = original_page['/Rotate']
+        return page
+    
+    def _pipeline(self):
+        if self.render_backend == 'process' and self.render_workers > 1:
+            return SharedMemoryRenderPipeline(self.render_workers, self.render_queue_size)
+        return RenderPipeline(self.render_workers, self.render_queue_size)
+    
+    def _get_vector_renderer(self, is_qrcode):
+        if is_qrcode:
+            if self._qr_vector_renderer is None:
+                self._qr_vector_renderer = QRVectorRenderer()
+            return self._qr_vector_renderer
+        if self._vector_renderer is None:
+            self._vector_renderer = Code128VectorRenderer()
+        return self._vector_renderer
+    
+    def _rendered(self, jobs, generator, is_qrcode):
+        '''(data, placement) の列に対して生成済みのコード画像を投入順に返す'''
+        return render_placements(generator, jobs, self._pipeline(), self.encoder,
+                                 self.code_renderer == 'vector')
+    
+    def _add_codes_fitz(self, mode, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode):
         try:
-            from reportlab.lib.utils import ImageReader
-            can.drawImage(temp_path, x, y, 
-                        width=width, height=height, 
-                        mask='auto', preserveAspectRatio=True)
-        finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+            # ページ送りありの一括配置は出力が大きくなるため常に逐次書き出す
+            if self.stream_output or mode == 'paginate':
+                stamper = FitzStamper(self.code_renderer, self.template_mode,
+                                      self.stream_chunk_pages, self.memory_limit_mb,
+                                      pipeline=self._pipeline(), compaction=self.compaction,
+                                      encoder=self.encoder)
+            else:
+                stamper = FitzStamper(self.code_renderer, self.template_mode,
+                                      pipeline=self._pipeline(), compaction=self.compaction,
+                                      encoder=self.encoder)
+            
+            if mode == 'continuous':
+                stamper.add_codes_continuous(input_pdf, output_pdf, data_list, positions,
+                                             generator, size_dict, is_qrcode)
+            elif mode == 'paginate':
+                stamper.add_codes_paginated(input_pdf, output_pdf, data_list, positions,
+                                            generator, size_dict, is_qrcode)
+            else:
+                stamper.add_codes_batch(input_pdf, output_pdf, data_list, positions,
+                                        generator, size_dict, is_qrcode)
+            
+            self.last_stats = stamper.stats
+            if (self.stream_output or mode == 'paginate') and self.last_stats:
+                print(f"出力: {self.last_stats['pages']}ページ / 書き出し{self.last_stats['chunks']}回 / "
+                      f"ピークメモリ {self.last_stats['peak_rss'] / (1024 * 1024):.1f}MB")
+            return True
+            
+        except Exception as e:
+            print(f"PDF作成エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def _compact(self, output_pdf):
+        '''PyPDF2で書き出した出力を圧縮プリセットで保存し直す'''
+        sizes = compact_pdf(output_pdf, self.compaction)
+        if sizes:
+            print(f"圧縮: {sizes[0] / (1024 * 1024):.1f}MB → {sizes[1] / (1024 * 1024):.1f}MB")
+    
+    def _worker_options(self):
+        '''ワーカープロセス側で同じ設定のPDFHandlerを作るための引数'''
+        return {
+            'code_renderer': self.code_renderer,
+            'engine': self.engine,
+            'template_mode': self.template_mode,
+            'stream_output': self.stream_output,
+            'stream_chunk_pages': self.stream_chunk_pages,
+            'memory_limit_mb': self.memory_limit_mb,
+            'image_encoding': self.image_encoding,
+            'image_scale': self.image_scale,
+        }
+    
+    def _add_codes_continuous_parallel(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode):
+        '''レコードをシャードに分けてプロセス並列で部分PDFを作り、順番どおりに連結'''
+        try:
+            options = self._worker_options()
+            shards = split_shards(data_list, self.workers)
+            self.last_stats = run_sharded(
+                _continuous_shard, output_pdf, shards,
+                lambda part_path, start, shard: (options, input_pdf, part_path, shard, positions,
+                                                 generator, size_dict, is_qrcode),
+                self.workers,
+                self.stream_chunk_pages if self.stream_output else None,
+                compaction_options(self.compaction)
+            )
+            return True
+            
+        except Exception as e:
+            print(f"PDF作成エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
     
     def add_codes_continuous(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode=False):
         '''連続印刷モード'''
+        if self.workers > 1 and len(data_list) >= PARALLEL_MIN_RECORDS:
+            return self._add_codes_continuous_parallel(input_pdf, output_pdf, data_list, positions,
+                                                       generator, size_dict, is_qrcode)
+        
+        if self.engine == 'fitz' or self.stream_output:
+            return self._add_codes_fitz('continuous', input_pdf, output_pdf, data_list,
+                                        positions, generator, size_dict, is_qrcode)
+        
         try:
             reader = PdfReader(input_pdf)
             writer = PdfWriter()
+            plan = PlacementPlan.for_reader(positions, size_dict, reader)
+            rendered = self._rendered(
+                ((data, placement) for data in data_list for placement in plan),
+                generator, is_qrcode
+            )
+            
+            pages_with_codes = [page_num for page_num in range(len(reader.pages)) if plan.on_page(page_num)]
+            # PdfWriterは取り込み済みのオブジェクトを読み込み元の id() で管理するため、
+            # 書き出しが終わるまで重ね合わせ用のReaderを解放しない（解放後に同じidが再利用されると取り違える）
+            overlay = self._draw_overlays(
+                ((plan.page_sizes[page_num], [(data, placement) for placement in plan.on_page(page_num)])
+                 for data in data_list for page_num in pages_with_codes),
+                is_qrcode, rendered
+            )
+            overlay_pages = iter(overlay.pages)
             
             for data in data_list:
                 for page_num, original_page in enumerate(reader.pages):
                     page = original_page
                     
-                    page_positions = [pos for pos in positions if pos['page'] == page_num]
-                    
-                    if page_positions:
-                        packet = BytesIO()
-                        page_width = float(page.mediabox.width)
-                        page_height = float(page.mediabox.height)
-                        can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-                        
-                        for pos in page_positions:
-                            code_width, code_height = size_dict[pos['size']]
-                            
-                            if is_qrcode:
-                                code_img = generator.generate_qrcode_with_text(
-                                    data['barcode'],
-                                    data['name'],
-                                    code_width
-                                )
-                            else:
-                                code_img = generator.generate_barcode_with_text(
-                                    data['barcode'],
-                                    data['name'],
-                                    code_width,
-                                    code_height
-                                )
-                            
-                            if code_img:
-                                pdf_x = pos['x']
-                                pdf_y = page_height - pos['y'] - code_height
-                                
-                                self._add_code_to_canvas(can, code_img, pdf_x, pdf_y, 
-                                                       code_width, code_height)
-                        
-                        can.save()
-                        packet.seek(0)
-                        
-                        barcode_pdf = PdfReader(packet)
-                        page.merge_page(barcode_pdf.pages[0])
+                    if plan.on_page(page_num):
+                        # 元ページに直接合成すると次のレコードに重ね合わせが残るため、新しいページに合成する
+                        page = self._overlay_page(original_page, next(overlay_pages))
                     
                     writer.add_page(page)
             
             with open(output_pdf, 'wb') as output_file:
                 writer.write(output_file)
+            self._compact(output_pdf)
             
             return True
             
@@ -130,59 +357,48 @@ class PDFHandler:
             traceback.print_exc()
             return False
     
-    def add_codes_batch(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode=False):
-        '''一括配置モード'''
+    def add_codes_batch(self, input_pdf, output_pdf, data_list, positions, generator, size_dict, is_qrcode=False,
+                        paginate=False):
+        '''
+        一括配置モード
+        paginate: Trueならレコードを全ページの配置位置に順番に割り当て、
+                  配置位置が足りなければテンプレートを複製して続ける（出力は逐次書き出し）
+                  Falseなら各ページの配置位置にレコードを先頭から割り当て、あふれた分は配置しない
+        '''
+        if paginate:
+            return self._add_codes_fitz('paginate', input_pdf, output_pdf, data_list,
+                                        positions, generator, size_dict, is_qrcode)
+        
+        if self.engine == 'fitz':
+            return self._add_codes_fitz('batch', input_pdf, output_pdf, data_list,
+                                        positions, generator, size_dict, is_qrcode)
+        
         try:
             reader = PdfReader(input_pdf)
             writer = PdfWriter()
+            plan = PlacementPlan.for_reader(positions, size_dict, reader)
+            rendered = self._rendered(
+                ((data, placement) for placements in plan.pages for placement, data in zip(placements, data_list)),
+                generator, is_qrcode
+            )
+            
+            # 書き出しが終わるまで重ね合わせ用のReaderを解放しない（連続印刷モードと同じ理由）
+            overlay = self._draw_overlays(
+                ((plan.page_sizes[page_num], [(data, placement) for placement, data in zip(placements, data_list)])
+                 for page_num, placements in enumerate(plan.pages) if placements and data_list),
+                is_qrcode, rendered
+            )
+            overlay_pages = iter(overlay.pages)
             
             for page_num, page in enumerate(reader.pages):
-                page_positions = [pos for pos in positions if pos['page'] == page_num]
-                
-                if page_positions and data_list:
-                    packet = BytesIO()
-                    page_width = float(page.mediabox.width)
-                    page_height = float(page.mediabox.height)
-                    can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-                    
-                    for i, data in enumerate(data_list):
-                        if i >= len(page_positions):
-                            break
-                        
-                        pos = page_positions[i]
-                        code_width, code_height = size_dict[pos['size']]
-                        
-                        if is_qrcode:
-                            code_img = generator.generate_qrcode_with_text(
-                                data['barcode'],
-                                data['name'],
-                                code_width
-                            )
-                        else:
-                            code_img = generator.generate_barcode_with_text(
-                                data['barcode'],
-                                data['name'],
-                                code_width,
-                                code_height
-                            )
-                        
-                        if code_img:
-                            pdf_x = pos['x']
-                            pdf_y = page_height - pos['y'] - code_height
-                            
-                            self._add_code_to_canvas(can, code_img, pdf_x, pdf_y, 
-                                                   code_width, code_height)
-                    
-                    can.save()
-                    packet.seek(0)
-                    
-                    barcode_pdf = PdfReader(packet)
-                    page.merge_page(barcode_pdf.pages[0])
+                if plan.on_page(page_num) and data_list:
+                    page.merge_page(self._align_overlay(next(overlay_pages), page))
                 
                 writer.add_page(page)
             
             with open(output_pdf, 'wb') as output_file:
                 writer.write(output_file)
+            self._compact(output_pdf)
             
             return True
             
@@ -191,3 +407,12 @@ class PDFHandler:
             import traceback
             traceback.print_exc()
             return False
+
+
+def _continuous_shard(task):
+    '''並列実行時のワーカー: シャード1つ分を部分PDFに書き出す'''
+    options, input_pdf, part_path, shard, positions, generator, size_dict, is_qrcode = task
+    handler = PDFHandler(**options)
+    if not handler.add_codes_continuous(input_pdf, part_path, shard, positions,
+                                        generator, size_dict, is_qrcode):
+        raise RuntimeError(f"部分PDFの作成に失敗しました: {part_path}")
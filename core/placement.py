@@ -0,0 +1,71 @@
+class Placement:
+    '''配置位置1つ分（サイズとPDF座標を計算済み）'''
+    
+    __slots__ = ('index', 'page', 'size', 'x', 'y', 'width', 'height', 'pdf_x', 'pdf_y')
+    
+    def __init__(self, index, pos, width, height, page_height):
+        self.index = index
+        self.page = pos['page']
+        self.size = pos['size']
+        # x, y はページ左上原点（画面での指定どおり）
+        self.x = pos['x']
+        self.y = pos['y']
+        self.width = width
+        self.height = height
+        # reportlab用の左下原点の座標
+        self.pdf_x = pos['x']
+        self.pdf_y = page_height - pos['y'] - height
+    
+    @property
+    def rect(self):
+        '''左上原点の (x0, y0, x1, y1)'''
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+
+class PlacementPlan:
+    '''
+    ジョブごとに1回だけ作る配置計画
+    配置位置をページごとに分け、サイズとPDF座標を事前に計算しておく
+    '''
+    
+    def __init__(self, positions, size_dict, page_sizes):
+        '''
+        positions: {'page', 'x', 'y', 'size'} のリスト
+        size_dict: サイズ名 -> (幅, 高さ)
+        page_sizes: 各ページの (幅, 高さ)（ページ数より後ろを指す位置は無視する）
+        '''
+        self.page_sizes = page_sizes
+        self.pages = [[] for _ in page_sizes]
+        for index, pos in enumerate(positions):
+            page_num = pos['page']
+            if not 0 <= page_num < len(page_sizes):
+                continue
+            width, height = size_dict[pos['size']]
+            self.pages[page_num].append(Placement(index, pos, width, height, page_sizes[page_num][1]))
+    
+    @classmethod
+    def for_reader(cls, positions, size_dict, reader):
+        '''PyPDF2のPdfReaderのmediaboxから作る'''
+        return cls(positions, size_dict,
+                   [(float(page.mediabox.width), float(page.mediabox.height)) for page in reader.pages])
+    
+    @classmethod
+    def for_document(cls, positions, size_dict, doc):
+        '''PyMuPDFのDocumentから作る'''
+        return cls(positions, size_dict, [(page.rect.width, page.rect.height) for page in doc])
+    
+    @property
+    def page_count(self):
+        return len(self.pages)
+    
+    def on_page(self, page_num):
+        if 0 <= page_num < len(self.pages):
+            return self.pages[page_num]
+        return []
+    
+    def __iter__(self):
+        for placements in self.pages:
+            yield from placements
+    
+    def __len__(self):
+        return sum(len(placements) for placements in self.pages)
@@ -0,0 +1,182 @@
+import qrcode
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from qrcode import util
+from qrcode.exceptions import DataOverflowError
+from core.code128_encoder import bar_runs
+
+MASK_PATTERNS = range(8)
+# キャッシュ済みのマスクは、評価値（ペナルティ）が選んだときの値のこの倍率以内なら使い回す
+CACHED_MASK_TOLERANCE = 1.2
+
+
+def char_capacity(mode, bits):
+    '''データ部 bits ビットに入る文字数（8ビットバイトモードはバイト数）'''
+    if mode == util.MODE_NUMBER:
+        # 3桁ごとに10ビット、端数は1桁4ビット・2桁7ビット
+        rest = bits % 10
+        return bits // 10 * 3 + (2 if rest >= 7 else 1 if rest >= 4 else 0)
+    if mode == util.MODE_ALPHA_NUM:
+        # 2文字ごとに11ビット、端数は1文字6ビット
+        return bits // 11 * 2 + (1 if bits % 11 >= 6 else 0)
+    return bits // 8
+
+
+def build_capacity_table(error_correction):
+    '''誤り訂正レベルごとの {モード: バージョン1〜40の最大文字数} を作る'''
+    limits = util.BIT_LIMIT_TABLE[error_correction]
+    table = {}
+    for mode in (util.MODE_NUMBER, util.MODE_ALPHA_NUM, util.MODE_8BIT_BYTE):
+        table[mode] = [
+            # モード指示子4ビットと文字数指示子を除いた分がデータ部
+            char_capacity(mode, limits[version] - 4 - util.length_in_bits(mode, version))
+            for version in range(1, 41)
+        ]
+    return table
+
+
+def module_runs(matrix):
+    '''モジュール行列を黒モジュールの横方向の並び (行, 開始位置, 幅) のリストに変換'''
+    runs = []
+    for row, cells in enumerate(matrix):
+        modules = ''.join('1' if cell else '0' for cell in cells)
+        runs.extend((row, start, run) for start, run in bar_runs(modules))
+    return runs
+
+
+class QREncoder:
+    '''
+    QRコードのエンコード結果（モジュール行列と黒モジュールのラン）をLRUでキャッシュする
+    行列には余白を含めない（余白は描画側で付ける）
+    同じエンコーダーを一連のジョブで使い回すと、容量表・マスクの選択結果も引き継がれる
+    '''
+    
+    def __init__(self, max_entries=4096, error_correction=qrcode.constants.ERROR_CORRECT_L,
+                 fast=False, mask_pattern=None):
+        '''
+        fast: Trueならバージョンを容量表から直接決め、データを1つのセグメントとして符号化する
+              （qrcodeの最小バージョン探索とデータ分割を行わない）
+        mask_pattern: None (毎回8種類のマスクを評価して選ぶ) /
+                      0〜7 (固定のマスクを使う) /
+                      'cached' (バージョンごとに選んだマスクを、評価値が大きく悪化しない限り以降も使う)
+        '''
+        if mask_pattern not in (None, 'cached') and mask_pattern not in MASK_PATTERNS:
+            raise ValueError(f"不明なマスクパターン: {mask_pattern}")
+        self.max_entries = max_entries
+        self.error_correction = error_correction
+        self.fast = fast
+        self.mask_pattern = mask_pattern
+        self.capacity = build_capacity_table(error_correction) if fast else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._masks = {}
+        self._lock = threading.Lock()
+    
+    def __getstate__(self):
+        # 別プロセスへは設定と選択済みのマスクだけを渡す
+        return {'max_entries': self.max_entries, 'error_correction': self.error_correction,
+                'fast': self.fast, 'mask_pattern': self.mask_pattern, 'masks': dict(self._masks)}
+    
+    def __setstate__(self, state):
+        self.__init__(state['max_entries'], state['error_correction'], state['fast'], state['mask_pattern'])
+        self._masks.update(state['masks'])
+    
+    def version_for(self, data):
+        '''容量表からデータ（QRData）が収まる最小のバージョンを返す'''
+        version = bisect_left(self.capacity[data.mode], len(data)) + 1
+        if version > 40:
+            raise DataOverflowError()
+        return version
+    
+    def _evaluate_masks(self, qr):
+        '''8種類のマスクを評価して (マスク番号, ペナルティ) を返す（qrcodeの best_mask_pattern と同じ）'''
+        best = None
+        for mask in MASK_PATTERNS:
+            qr.makeImpl(True, mask)
+            point = util.lost_point(qr.modules)
+            if best is None or point < best[1]:
+                best = (mask, point)
+        return best
+    
+    def _choose_mask(self, qr):
+        '''使用するマスク番号を決める'''
+        if self.mask_pattern in MASK_PATTERNS:
+            return self.mask_pattern
+        if self.mask_pattern != 'cached':
+            return qr.best_mask_pattern()
+        
+        with self._lock:
+            cached = self._masks.get(qr.version)
+        if cached is not None:
+            # 読み取りにくいパターンにならないよう、キャッシュしたマスクの評価値だけは確認する
+            mask, reference = cached
+            qr.makeImpl(True, mask)
+            if util.lost_point(qr.modules) <= reference * CACHED_MASK_TOLERANCE:
+                return mask
+        
+        mask, point = self._evaluate_masks(qr)
+        with self._lock:
+            self._masks[qr.version] = (mask, point)
+        return mask
+    
+    def _make(self, key):
+        '''QRコードを組み立てて返す'''
+        if self.fast:
+            data = util.QRData(key)
+            qr = qrcode.QRCode(version=self.version_for(data), error_correction=self.error_correction, border=0)
+            qr.add_data(data)
+        else:
+            # 最小サイズ（21x21セル）から収まるバージョンを選ぶ
+            qr = qrcode.QRCode(version=1, error_correction=self.error_correction, border=0)
+            qr.add_data(key)
+            qr.best_fit(start=qr.version)
+        
+        qr.makeImpl(False, self._choose_mask(qr))
+        return qr
+    
+    def _lookup(self, qr_data):
+        key = str(qr_data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        qr = self._make(key)
+        matrix = tuple(tuple(row) for row in qr.get_matrix())
+        entry = (matrix, tuple(module_runs(matrix)))
+        
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+    
+    def matrix(self, qr_data):
+        '''モジュール行列（True=黒）を返す'''
+        return self._lookup(qr_data)[0]
+    
+    def runs(self, qr_data):
+        '''黒モジュールの (行, 開始位置, 幅) のタプルを返す'''
+        return self._lookup(qr_data)[1]
+    
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'masks': dict(self._masks)}
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._masks.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 全レンダラーで共有するエンコーダー
+default_qr_encoder = QREncoder()
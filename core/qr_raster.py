@@ -0,0 +1,38 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# QRCodeGeneratorの余白（モジュール数）
+QUIET_ZONE_MODULES = 2
+
+
+def is_available():
+    return np is not None
+
+
+def render_modules(matrix, size, quiet_zone=QUIET_ZONE_MODULES, snap=True):
+    '''
+    モジュール行列を size x size のグレースケール配列（0=黒, 255=白）に描画
+    snap: Trueなら1モジュールが整数ピクセルになるように揃え、余りは上下左右に均等配分する
+          Falseならモジュールを最近傍で割り当てて size 全体に広げる（プリンタDPIでの描画向け）
+    '''
+    dark = np.array(matrix, dtype=bool)
+    count = dark.shape[0]
+    total_modules = count + quiet_zone * 2
+    module_px = size // total_modules
+    
+    bitmap = np.full((size, size), 255, dtype=np.uint8)
+    if snap and module_px >= 1:
+        # モジュールをピクセル単位にスナップして拡大
+        offset = (size - module_px * total_modules) // 2 + quiet_zone * module_px
+        cells = np.repeat(np.repeat(dark, module_px, axis=0), module_px, axis=1)
+        bitmap[offset:offset + cells.shape[0], offset:offset + cells.shape[1]][cells] = 0
+    else:
+        # 最近傍でモジュールを割り当てる（サイズが足りない場合も同じ）
+        index = np.arange(size) * total_modules // size - quiet_zone
+        inside = (index >= 0) & (index < count)
+        clipped = np.clip(index, 0, count - 1)
+        cells = dark[np.ix_(clipped, clipped)] & inside[:, None] & inside[None, :]
+        bitmap[cells] = 0
+    return bitmap
@@ -0,0 +1,110 @@
+from reportlab.pdfbase import pdfmetrics
+from core.code128_vector import LABEL_FONT, FITZ_LABEL_FONT, register_label_font
+from core.qr_encoder import default_qr_encoder
+from core.qr_raster import QUIET_ZONE_MODULES
+
+# 下部テキスト領域の高さ（QRコードの一辺に対する割合、ラスター版と同じ）
+TEXT_RATIO = 0.25
+
+
+def qr_layout(width, height):
+    '''
+    width x height の範囲に収まるQRコードの一辺を返す
+    ラスター版（一辺 x 1.25倍の高さ）を縦横比を保って貼り付けた場合と同じ大きさ
+    '''
+    return min(width, height / (1 + TEXT_RATIO))
+
+
+class QRVectorRenderer:
+    '''
+    QRコードをreportlabキャンバスへ矩形とテキストで直接描画する
+    黒モジュールは横方向のランごとに1つの矩形にまとめる
+    '''
+    
+    def __init__(self, font_name=LABEL_FONT, encoder=None):
+        '''encoder: QREncoder（省略時は共有の default_qr_encoder）'''
+        self.font_name = register_label_font(font_name)
+        self.encoder = encoder or default_qr_encoder
+    
+    def draw(self, can, qr_data, display_text, x, y, width, height):
+        '''(x, y) を左下とする width x height の範囲の中央にQRコードを描画'''
+        try:
+            size = qr_layout(width, height)
+            text_height = size * TEXT_RATIO
+            left = x + (width - size) / 2
+            bottom = y + (height - size - text_height) / 2
+            top = bottom + text_height + size
+            
+            matrix = self.encoder.matrix(qr_data)
+            module = size / (len(matrix) + QUIET_ZONE_MODULES * 2)
+            
+            can.saveState()
+            can.setFillColorRGB(0, 0, 0)
+            
+            path = can.beginPath()
+            for row, start, run in self.encoder.runs(qr_data):
+                cell_x = left + (start + QUIET_ZONE_MODULES) * module
+                cell_y = top - (row + QUIET_ZONE_MODULES + 1) * module
+                path.rect(cell_x, cell_y, run * module, module)
+            can.drawPath(path, stroke=0, fill=1)
+            
+            # テキストを中央配置（幅を超える場合は縮小）
+            if display_text:
+                font_size = text_height * 0.6
+                text_width = pdfmetrics.stringWidth(display_text, self.font_name, font_size)
+                if text_width > size:
+                    font_size *= size / text_width
+                can.setFont(self.font_name, font_size)
+                baseline = bottom + (text_height - font_size) / 2 + font_size * 0.12
+                can.drawCentredString(left + size / 2, baseline, display_text)
+            
+            can.restoreState()
+            return True
+        
+        except Exception as e:
+            print(f"QRコード描画エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def draw_on_page(self, page, qr_data, display_text, rect):
+        '''PyMuPDFのページへ描画（rect は左上原点のページ座標）'''
+        try:
+            import fitz
+            
+            size = qr_layout(rect.width, rect.height)
+            text_height = size * TEXT_RATIO
+            left = rect.x0 + (rect.width - size) / 2
+            top = rect.y0 + (rect.height - size - text_height) / 2
+            
+            matrix = self.encoder.matrix(qr_data)
+            module = size / (len(matrix) + QUIET_ZONE_MODULES * 2)
+            
+            shape = page.new_shape()
+            for row, start, run in self.encoder.runs(qr_data):
+                cell_x = left + (start + QUIET_ZONE_MODULES) * module
+                cell_y = top + (row + QUIET_ZONE_MODULES) * module
+                shape.draw_rect(fitz.Rect(cell_x, cell_y, cell_x + run * module, cell_y + module))
+            shape.finish(color=None, fill=(0, 0, 0), width=0)
+            
+            # テキストを中央配置（幅を超える場合は縮小）
+            if display_text:
+                font_size = text_height * 0.6
+                text_bottom = top + size + text_height
+                for _ in range(8):
+                    text_top = top + size + (text_height - font_size) / 2 - font_size * 0.2
+                    text_rect = fitz.Rect(left, text_top, left + size, text_bottom + font_size)
+                    rc = shape.insert_textbox(text_rect, display_text, fontname=FITZ_LABEL_FONT,
+                                              fontsize=font_size, align=fitz.TEXT_ALIGN_CENTER)
+                    if rc >= 0:
+                        break
+                    font_size *= 0.85
+            
+            shape.commit()
+            return True
+        
+        except Exception as e:
+            print(f"QRコード描画エラー: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
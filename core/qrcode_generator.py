@@ -1,66 +1,123 @@
 import qrcode
 from qrcode.image.pil import PilImage
-from PIL import Image, ImageDraw, ImageFont
-import os
+from PIL import Image, ImageDraw
+from core import qr_raster
+from core.code_image import GenerationBatch, generate_batch, check_image_mode, to_image_mode
+from core.font_registry import label_fonts
+from core.qr_encoder import default_qr_encoder
+
+
+class QRCodeBatch(GenerationBatch):
+    '''QRCodeGenerator.generate_many 1回分（サイズは一辺、または (幅, 高さ) なら幅を一辺とする）'''
+    
+    def generate(self, qr_data, display_text, size):
+        target_size = size[0] if isinstance(size, (tuple, list)) else size
+        return self.generator.generate_qrcode_with_text(qr_data, display_text, target_size, batch=self)
+
 
 class QRCodeGenerator:
-    def generate_qrcode_with_text(self, qr_data, display_text, target_size=100):
+    def __init__(self, engine=None, dpi=None, cache=None, encoder=None, mode='RGB'):
+        '''
+        engine: 'numpy' (モジュール行列を目標サイズで直接描画) または
+                'qrcode' (qrcodeのmake_imageで生成して縮小)
+                省略時はNumPyが使えれば 'numpy'
+        dpi: 指定するとサイズをポイントとみなし、そのDPIのピクセル数で描画
+             PDFに貼る場合は指定すること（未指定の 'numpy' はモジュールを整数ピクセルに揃えるため小さくなる）
+        cache: RenderedCodeCache（生成済み画像を再利用）
+        encoder: QREncoder（'numpy' で使用。高速モードのエンコーダーを渡すと一連のジョブでマスクの選択結果を使い回す）
+                 省略時は共有の default_qr_encoder
+        mode: 生成する画像の画素形式 'RGB' / 'L' / '1'
+              'L' と '1' はキャンバスからその形式で合成し、RGBへの変換を行わない
+        '''
+        if engine is None:
+            engine = 'numpy' if qr_raster.is_available() else 'qrcode'
+        self.engine = engine
+        self.dpi = dpi
+        self.cache = cache
+        self.encoder = encoder
+        self.mode = check_image_mode(mode)
+    
+    def generate_many(self, records, pipeline=None, transform=None):
+        '''
+        複数件をまとめて生成し、画像を入力順に返すジェネレータ（取り出した分だけ生成する）
+        records: (qr_data, display_text, target_size) の列
+        pipeline: RenderPipeline / SharedMemoryRenderPipeline を渡すとワーカーで並列に生成
+        transform: transform(画像, target_size) を各画像に続けて適用し、その結果を返す（ワーカー側で実行）
+        '''
+        return generate_batch(QRCodeBatch(self, transform), records, pipeline)
+    
+    def generate_qrcode_with_text(self, qr_data, display_text, target_size=100, batch=None):
         '''
         QRコードと下部テキストを含む画像を生成
         target_size: QRコードのサイズ（正方形）
+        batch: generate_many から呼ばれた場合のバッチ（フォントを共有する）
         '''
+        cache_key = None
+        if self.cache is not None:
+            options = {'engine': self.engine}
+            if self.encoder is not None and self.encoder.fast:
+                options['fast'] = str(self.encoder.mask_pattern)
+            if self.dpi:
+                options['dpi'] = self.dpi
+            if self.mode != 'RGB':
+                options['mode'] = self.mode
+            cache_key = self.cache.make_key('qrcode', qr_data, display_text, (target_size,), options)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        img = self._generate(qr_data, display_text, target_size, batch)
+        
+        if img is not None and cache_key is not None:
+            self.cache.put(cache_key, img)
+        return img
+    
+    def _render_qr(self, qr_data, target_size):
+        '''QRコード部分（正方形）の画像を生成'''
+        if self.engine == 'numpy':
+            # キャッシュ済みのモジュール行列を目標サイズで直接描画（リサンプリングなし）
+            # DPI指定時は1ピクセル単位の揃えよりも印刷サイズを優先する
+            encoder = self.encoder or default_qr_encoder
+            bitmap = qr_raster.render_modules(encoder.matrix(qr_data), target_size, snap=not self.dpi)
+            return Image.fromarray(bitmap, 'L')
+        
+        # QRコード生成（最小サイズ設定）
+        qr = qrcode.QRCode(
+            version=1,  # 最小サイズ（21x21セル）
+            error_correction=qrcode.constants.ERROR_CORRECT_L,  # 最小誤り訂正
+            box_size=10,  # 各セルのピクセルサイズ
+            border=qr_raster.QUIET_ZONE_MODULES,  # 余白（最小は4だが、2で十分）
+        )
+        
+        qr.add_data(str(qr_data))
+        qr.make(fit=True)
+        
+        # 高解像度で生成
+        qr_img = qr.make_image(fill_color="black", back_color="white")
+        
+        # QRコード部分をリサイズ
+        return qr_img.resize((target_size, target_size), Image.Resampling.LANCZOS)
+    
+    def _generate(self, qr_data, display_text, target_size, batch=None):
         try:
-            # QRコード生成（最小サイズ設定）
-            qr = qrcode.QRCode(
-                version=1,  # 最小サイズ（21x21セル）
-                error_correction=qrcode.constants.ERROR_CORRECT_L,  # 最小誤り訂正
-                box_size=10,  # 各セルのピクセルサイズ
-                border=2,  # 余白（最小は4だが、2で十分）
-            )
-            
-            qr.add_data(str(qr_data))
-            qr.make(fit=True)
-            
-            # 高解像度で生成
-            qr_img = qr.make_image(fill_color="black", back_color="white")
+            if self.dpi:
+                target_size = int(round(target_size * self.dpi / 72))
             
-            # QRコード部分をリサイズ
-            qr_img = qr_img.resize((target_size, target_size), Image.Resampling.LANCZOS)
+            qr_img = self._render_qr(qr_data, target_size)
             
             # テキスト部分の高さ
             text_height = int(target_size * 0.25)
             total_height = target_size + text_height
             
             # 最終画像を作成
-            combined_img = Image.new('RGB', (target_size, total_height), 'white')
-            combined_img.paste(qr_img, (0, 0))
+            combined_img = Image.new(self.mode, (target_size, total_height), 'white')
+            combined_img.paste(to_image_mode(qr_img, self.mode), (0, 0))
             
             # テキストを描画
             draw = ImageDraw.Draw(combined_img)
             
-            font = None
             font_size = int(text_height * 0.6)
-            font_paths = [
-                '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',
-                '/System/Library/Fonts/Hiragino Sans GB.ttc',
-                '/Library/Fonts/Arial Unicode.ttf',
-                '/System/Library/Fonts/Supplemental/Arial Unicode.ttf',
-                '/System/Library/Fonts/Supplemental/Arial.ttf'
-            ]
-            
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        font = ImageFont.truetype(font_path, font_size)
-                        break
-                    except:
-                        continue
-            
-            if font is None:
-                try:
-                    font = ImageFont.truetype("arial.ttf", font_size)
-                except:
-                    font = ImageFont.load_default()
+            font = batch.font(font_size) if batch else label_fonts.get_font(font_size)
             
             # テキストを中央配置
             bbox = draw.textbbox((0, 0), display_text, font=font)
@@ -0,0 +1,47 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_render_workers():
+    # 書き込みは1スレッドのため、生成側はコア数より少し控えめにする
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+class RenderPipeline:
+    '''
+    コード画像の生成をスレッドプールで先行させ、書き込み側には投入順に渡す
+    PILのリサイズ・エンコードやPyMuPDFはGILを解放するため、生成とPDFの組み立てが並行して進む
+    '''
+    
+    def __init__(self, workers=1, queue_size=None):
+        '''
+        workers: 生成スレッド数（1なら書き込み側のスレッドで順番に生成）
+        queue_size: 先行して生成しておく最大件数（省略時は workers の2倍）
+        '''
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size or self.workers * 2)
+    
+    def map(self, render, jobs):
+        '''jobs の各要素を render で生成し、(job, 結果) を投入順に返すジェネレータ'''
+        if self.workers == 1:
+            for job in jobs:
+                yield job, render(job)
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='code-render')
+        pending = deque()
+        try:
+            for job in jobs:
+                # キューが一杯なら先頭の完成を待ってから次を投入する（先行しすぎてメモリを使わない）
+                if len(pending) >= self.queue_size:
+                    done_job, future = pending.popleft()
+                    yield done_job, future.result()
+                pending.append((job, executor.submit(render, job)))
+            
+            while pending:
+                done_job, future = pending.popleft()
+                yield done_job, future.result()
+        finally:
+            # 途中で中断された場合は未着手の生成を取り消す
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,153 @@
+import atexit
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from PIL import Image
+from core.render_pipeline import default_render_workers
+
+# 1スロットの大きさ（300dpiで描画したコード画像が収まるサイズ）
+DEFAULT_SLOT_BYTES = 4 * 1024 * 1024
+
+# ワーカー側で接続済みの共有メモリ
+_attached = {}
+# 画像がまだ参照していて閉じられなかった共有メモリ（後で閉じ直す）
+_retired = []
+
+
+def to_transport_mode(img):
+    '''共有メモリで渡す画素形式に揃える（1ビットはそのまま、それ以外は8ビットグレー）'''
+    if img.mode in ('1', 'L'):
+        return img
+    return img.convert('L')
+
+
+def _attach(name):
+    shm = _attached.get(name)
+    if shm is None:
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.12以前: ワーカーは親と同じresource_trackerを共有するため、
+            # ここで登録を解除すると親のunlink時に解除済みのエラーになる
+            shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+def _render_into_slot(task):
+    '''
+    ワーカープロセス: 画像を生成してスロットに画素を書き込み、小さなヘッダだけを返す
+    ヘッダは (mode, size, スロット内のバイト数, スロットに収まらない場合の画素)
+    '''
+    render, job, shm_name, offset, slot_bytes = task
+    img = render(job)
+    if img is None:
+        return None
+    
+    img = to_transport_mode(img)
+    data = img.tobytes()
+    if len(data) > slot_bytes:
+        return (img.mode, img.size, 0, data)
+    
+    _attach(shm_name).buf[offset:offset + len(data)] = data
+    return (img.mode, img.size, len(data), None)
+
+
+def _close_retired():
+    '''以前閉じられなかった共有メモリのうち、参照がなくなったものを閉じる'''
+    for shm in list(_retired):
+        try:
+            shm.close()
+        except BufferError:
+            continue
+        _retired.remove(shm)
+
+
+atexit.register(_close_retired)
+
+
+class SharedImageRing:
+    '''親プロセスが確保する固定長スロットの共有メモリ（ワーカーは名前で接続して書き込む）'''
+    
+    def __init__(self, slots, slot_bytes=DEFAULT_SLOT_BYTES):
+        _close_retired()
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+    
+    @property
+    def name(self):
+        return self.shm.name
+    
+    def offset(self, slot):
+        return slot * self.slot_bytes
+    
+    def image(self, slot, header):
+        '''
+        スロットの画素からPIL画像を作る
+        8ビットはコピーせずに共有メモリを直接参照し、1ビットはパック形式から展開する
+        '''
+        if header is None:
+            return None
+        
+        mode, size, nbytes, data = header
+        if data is not None:
+            return Image.frombytes(mode, size, data)
+        
+        start = self.offset(slot)
+        return Image.frombuffer(mode, size, self.shm.buf[start:start + nbytes], 'raw', mode, 0, 1)
+    
+    def close(self):
+        self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            # 呼び出し側がまだ画像を保持している場合は、参照がなくなってから閉じる
+            # （SharedMemoryのデストラクタで閉じようとして警告が出るのを防ぐ）
+            _retired.append(self.shm)
+
+
+class SharedMemoryRenderPipeline:
+    '''
+    RenderPipelineのプロセス版
+    ワーカーは画像をpickleせず共有メモリのスロットに画素を書き込み、書き込み側へはヘッダだけを返す
+    render と各jobはpickle可能であること
+    '''
+    
+    def __init__(self, workers=None, queue_size=None, slot_bytes=DEFAULT_SLOT_BYTES):
+        '''
+        workers: 生成プロセス数
+        queue_size: 先行して生成しておく最大件数（省略時は workers の2倍）
+        slot_bytes: 1件分の画素を書き込むスロットの大きさ
+        '''
+        self.workers = max(1, workers or default_render_workers())
+        self.queue_size = max(1, queue_size or self.workers * 2)
+        self.slot_bytes = slot_bytes
+    
+    def map(self, render, jobs):
+        '''
+        jobs の各要素を render で生成し、(job, 画像) を投入順に返すジェネレータ
+        返した画像は共有メモリを参照しているため、次の要素を取り出した後まで保持しないこと
+        '''
+        # 生成中の件数 + 書き込み側が使用中の1件分
+        slots = self.queue_size + 1
+        ring = SharedImageRing(slots, self.slot_bytes)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        next_slot = 0
+        try:
+            for job in jobs:
+                if len(pending) >= self.queue_size:
+                    done_job, slot, future = pending.popleft()
+                    yield done_job, ring.image(slot, future.result())
+                
+                task = (render, job, ring.name, ring.offset(next_slot), ring.slot_bytes)
+                pending.append((job, next_slot, executor.submit(_render_into_slot, task)))
+                next_slot = (next_slot + 1) % slots
+            
+            while pending:
+                done_job, slot, future = pending.popleft()
+                yield done_job, ring.image(slot, future.result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            ring.close()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import fitz
+from core.memory_monitor import current_rss_bytes, peak_rss_bytes
+from core.pdf_compaction import DEFAULT_SAVE_OPTIONS, compact_pdf
+
+
+class StreamingPdfOutput:
+    '''
+    ページを追加しながら一定量ごとにディスクへ追記保存する出力PDF
+    chunk_pages: このページ数ごとに書き出す（None なら最後に1回だけ保存）
+    memory_limit_mb: 常駐メモリがこの値を超えたらページ数に関係なく書き出す
+    書き出しは出力先と同じフォルダの一時ファイルに行い、完了時に置き換える
+    save_options: 完了時の保存オプション（途中で書き出した場合は最後に保存し直して適用する）
+    '''
+    
+    def __init__(self, output_pdf, chunk_pages=None, memory_limit_mb=None, save_options=None):
+        self.output_pdf = output_pdf
+        self.save_options = save_options
+        self.chunk_pages = chunk_pages
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.doc = fitz.open()
+        self.page_count = 0
+        self.chunks = 0
+        self._pending_pages = 0
+        self._saved = False
+        
+        fd, self.temp_path = tempfile.mkstemp(
+            suffix='.pdf', dir=os.path.dirname(os.path.abspath(output_pdf))
+        )
+        os.close(fd)
+    
+    def pages_added(self, count=1):
+        '''ページ追加後に呼ぶ（必要なら書き出す）'''
+        self.page_count += count
+        self._pending_pages += count
+        
+        if self.chunk_pages and self._pending_pages >= self.chunk_pages:
+            self.flush()
+        elif self.memory_limit and current_rss_bytes() > self.memory_limit:
+            self.flush()
+    
+    def _write(self):
+        if not self._saved:
+            self.doc.save(self.temp_path, deflate=True)
+            self._saved = True
+        else:
+            # saveIncr は追加したストリームを圧縮しないため、deflate を指定して追記保存する
+            self.doc.save(self.temp_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+        self.chunks += 1
+        self._pending_pages = 0
+    
+    def flush(self):
+        '''書き出し済みページをメモリから解放する'''
+        if self._pending_pages == 0:
+            return
+        self._write()
+        
+        # 開き直してもテンプレートのXObjectを再利用できるよう対応表を引き継ぐ
+        shown_pages = dict(self.doc.ShownPages)
+        self.doc.close()
+        self.doc = fitz.open(self.temp_path)
+        self.doc.ShownPages.update(shown_pages)
+    
+    def finish(self):
+        if not self._saved:
+            # 一度も書き出していない場合は不要オブジェクトも除去して保存
+            self.doc.save(self.temp_path, **(self.save_options or DEFAULT_SAVE_OPTIONS))
+            self.chunks += 1
+            self.doc.close()
+        else:
+            if self._pending_pages:
+                self._write()
+            self.doc.close()
+            if self.save_options:
+                # 追記保存したファイルは不要オブジェクトが残るため保存し直す
+                compact_pdf(self.temp_path, self.save_options)
+        os.replace(self.temp_path, self.output_pdf)
+    
+    def abort(self):
+        if not self.doc.is_closed:
+            self.doc.close()
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+    
+    def stats(self):
+        return {
+            'pages': self.page_count,
+            'chunks': self.chunks,
+            'peak_rss': peak_rss_bytes(),
+        }
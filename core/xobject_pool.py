@@ -0,0 +1,85 @@
+import hashlib
+import weakref
+from collections import OrderedDict
+from reportlab.lib.utils import ImageReader
+
+# 再利用のために保持するImageReaderの数（reportlabも同じ内容の画像XObjectは1つにまとめる）
+MAX_READERS = 64
+
+
+class ImageXObjectPool:
+    '''
+    同じ内容のコード画像を出力PDF内で1回だけ埋め込み、以降は参照で再利用する
+    出力ファイル（ジョブ）ごとに作成すること
+    encoder (CodeImageEncoder) を指定すると、reportlabへの描画もその埋め込み方式で行う
+    画像そのものは保持しない（逐次書き出しでもメモリ使用量がレコード数に比例しない）
+    '''
+    
+    def __init__(self, encoder=None):
+        self.encoder = encoder
+        self.hits = 0
+        self.misses = 0
+        self._keys = {}
+        self._readers = OrderedDict()
+        self._encoded = set()
+        self._xrefs = {}
+    
+    def content_key(self, img):
+        '''画像内容のハッシュ（同じ画像オブジェクトは再計算しない）'''
+        image_id = id(img)
+        entry = self._keys.get(image_id)
+        if entry is not None and entry[0]() is img:
+            return entry[1]
+        
+        digest = hashlib.sha1()
+        digest.update(f'{img.mode}:{img.width}x{img.height}:'.encode('ascii'))
+        digest.update(img.tobytes())
+        key = digest.hexdigest()
+        
+        # 画像は弱参照で持ち、解放されたら登録も消す（同じ id() の別画像と取り違えないよう参照先も確認する）
+        keys = self._keys
+        
+        def forget(ref):
+            if keys.get(image_id, (None,))[0] is ref:
+                del keys[image_id]
+        
+        self._keys[image_id] = (weakref.ref(img, forget), key)
+        return key
+    
+    def draw_on_canvas(self, can, img, x, y, width, height, **kwargs):
+        '''reportlabキャンバスに描画（同じ内容ならImageReaderと画像XObjectを共有）'''
+        key = self.content_key(img)
+        if self.encoder is not None and self.encoder.bilevel:
+            if key in self._encoded:
+                self.hits += 1
+            else:
+                self._encoded.add(key)
+                self.misses += 1
+            self.encoder.draw_on_canvas(can, img, x, y, width, height, key=key, **kwargs)
+            return
+        
+        reader = self._readers.get(key)
+        if reader is None:
+            reader = ImageReader(img)
+            self._readers[key] = reader
+            if len(self._readers) > MAX_READERS:
+                self._readers.popitem(last=False)
+            self.misses += 1
+        else:
+            self._readers.move_to_end(key)
+            self.hits += 1
+        can.drawImage(reader, x, y, width=width, height=height, **kwargs)
+    
+    def insert_on_page(self, page, img, rect, insert):
+        '''
+        PyMuPDFのページに挿入（同じ内容・サイズなら既存の画像xrefを参照）
+        insert(page, img, rect) は初回のみ呼ばれ、画像を埋め込んでxrefを返す
+        '''
+        key = (self.content_key(img), round(rect.width, 3), round(rect.height, 3))
+        xref = self._xrefs.get(key)
+        if xref:
+            page.insert_image(rect, xref=xref, keep_proportion=True)
+            self.hits += 1
+        else:
+            self._xrefs[key] = insert(page, img, rect)
+            self.misses += 1
@@ -3,12 +3,16 @@ from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                                       QTableWidget, QTableWidgetItem, QSpinBox, QGroupBox,
                                       QScrollArea, QComboBox, QTextEdit, QDialog, QDialogButtonBox,
                                       QRadioButton, QButtonGroup)
-from PySide6.QtCore import Qt, Signal, QObject, QRect, QPoint, QRectF
-from PySide6.QtGui import QPixmap, QImage, QPainter, QPen, QColor, QBrush
+from PySide6.QtCore import Qt, Signal, QObject, QRect, QPoint, QRectF, QTimer
+from PySide6.QtGui import QPainter, QPen, QColor, QBrush
 from core.barcode_generator import BarcodeGenerator
 from core.qrcode_generator import QRCodeGenerator
 from core.pdf_handler import PDFHandler
+from core.render_pipeline import default_render_workers
 from core.excel_handler import ExcelHandler
+from core.code_cache import RenderedCodeCache
+from gui.page_renderer import PageRenderThread
+from gui.qt_image import qpixmap_from_fitz
 from version import __version__, __app_name__
 import os
 
@@ -185,34 +189,51 @@ class SizeSettingsDialog(QDialog):
 
 class ClickableLabel(QLabel):
     clicked = Signal(int, int)
+    zoom_requested = Signal(float, float, float)  # ホイール段数, 画像上のx, y
+    scroll_requested = Signal(int, int)
     
     def __init__(self):
         super().__init__()
         self.markers = []
         self.base_pixmap = None
+        # 表示中の画像が現在の倍率・範囲のものでない間はクリックを受け付けない
+        self.stale = False
         self.scale_factor = 1.0
         self.offset_x = 0
         self.offset_y = 0
     
+    def _image_pos(self, x, y):
+        '''ラベル上の座標を中央配置された画像上の座標に変換'''
+        offset_x = (self.width() - self.base_pixmap.width()) // 2
+        offset_y = (self.height() - self.base_pixmap.height()) // 2
+        return x - offset_x, y - offset_y
+    
     def mousePressEvent(self, event):
         click_x = event.pos().x()
         click_y = event.pos().y()
         
-        if self.base_pixmap:
+        if self.base_pixmap and not self.stale:
             pixmap_width = self.base_pixmap.width()
             pixmap_height = self.base_pixmap.height()
-            label_width = self.width()
-            label_height = self.height()
             
-            offset_x = (label_width - pixmap_width) // 2
-            offset_y = (label_height - pixmap_height) // 2
-            
-            image_x = click_x - offset_x
-            image_y = click_y - offset_y
+            image_x, image_y = self._image_pos(click_x, click_y)
             
             if 0 <= image_x < pixmap_width and 0 <= image_y < pixmap_height:
                 self.clicked.emit(image_x, image_y)
     
+    def wheelEvent(self, event):
+        if not self.base_pixmap:
+            return
+        
+        delta = event.angleDelta()
+        if event.modifiers() & Qt.ControlModifier:
+            # Ctrl+ホイールでカーソル位置を中心に拡大縮小
+            pos = event.position()
+            image_x, image_y = self._image_pos(pos.x(), pos.y())
+            self.zoom_requested.emit(delta.y() / 120, image_x, image_y)
+        else:
+            self.scroll_requested.emit(delta.x(), delta.y())
+    
     def add_marker(self, x, y, width, height):
         self.markers.append((x, y, width, height))
         self.update_display()
@@ -223,8 +244,20 @@ class ClickableLabel(QLabel):
     
     def set_base_pixmap(self, pixmap):
         self.base_pixmap = pixmap
+        self.stale = False
         self.update_display()
     
+    def mark_stale(self):
+        '''描画が届くまで表示中の画像を残したまま、クリックだけ止める'''
+        self.stale = True
+    
+    def clear_page(self):
+        '''表示中の画像とマーカーを消す'''
+        self.base_pixmap = None
+        self.markers = []
+        self.stale = False
+        self.clear()
+    
     def update_display(self):
         if self.base_pixmap:
             display_pixmap = self.base_pixmap.copy()
@@ -269,23 +302,51 @@ class MainWindow(QMainWindow):
             '大': (120, 120)
         }
         
-        self.pdf_handler = PDFHandler()
+        # 圧縮プリセット（compaction）・埋め込み方式（image_encoding）は既定のまま。出力を小さくする場合は明示的に指定する
+        self.pdf_handler = PDFHandler(render_workers=default_render_workers())
         self.excel_handler = ExcelHandler()
-        self.barcode_generator = BarcodeGenerator()
-        self.qrcode_generator = QRCodeGenerator()
+        # 生成済みコードはメモリ上でだけ再利用する（ディスクへの保存は cache_dir を指定した場合のみ）
+        self.code_cache = RenderedCodeCache()
+        self.barcode_generator = BarcodeGenerator(dpi=300, cache=self.code_cache)
+        # QRコードは qrcode と同じ手順（バージョン探索・マスク評価）で符号化する
+        # 高速モードは QREncoder(fast=True, ...) を encoder に渡した場合のみ
+        self.qrcode_generator = QRCodeGenerator(dpi=300, cache=self.code_cache)
         
         self.pdf_path = None
         self.excel_path = None
         self.barcode_positions = []
         self.current_page = 0
-        self.current_scale = 1.0
         self.original_page_size = (0, 0)
         self.current_code_size = '中'
         self.is_continuous_mode = True
         self.is_qrcode_mode = False  # False: バーコード, True: QRコード
         
+        # プレビューはラベルに収まる倍率で描画し、拡大時は表示範囲だけを切り出して描画する
+        self.MAX_VIEW_ZOOM = 8
+        self.view_zoom = 1.0  # ページ全体表示に対する拡大率
+        self.view_scale = 1.0  # 画面1ピクセルあたりのページ座標の逆数（ピクセル/pt）
+        self.view_origin = (0, 0)  # 表示範囲の左上（ページ座標）
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self.update_preview)
+        self.preview_generation = 0
+        self.shown_preview = None
+        self.shown_page = None  # 表示中の画像のページ
+        self.page_renderer = PageRenderThread(self.pdf_handler, self)
+        self.page_renderer.page_rendered.connect(self.on_page_rendered)
+        self.page_renderer.start()
+        
         self.init_ui()
     
+    def closeEvent(self, event):
+        self.page_renderer.stop()
+        super().closeEvent(event)
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # ドラッグ中に何度も描画しないよう、サイズが落ち着いてから描き直す
+        self.resize_timer.start(150)
+    
     def init_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -463,6 +524,9 @@ class MainWindow(QMainWindow):
         self.preview_label.setStyleSheet("QLabel { background-color: #f0f0f0; border: 2px solid #ccc; }")
         self.preview_label.setMinimumSize(600, 700)
         self.preview_label.clicked.connect(self.add_code_position)
+        self.preview_label.zoom_requested.connect(self.zoom_preview)
+        self.preview_label.scroll_requested.connect(self.scroll_preview)
+        self.preview_label.setToolTip("Ctrl+ホイールで拡大・縮小、ホイールで移動")
         
         layout.addWidget(self.preview_label)
         
@@ -571,13 +635,16 @@ class MainWindow(QMainWindow):
                 total_pages = page_count
                 total_positions = len(self.barcode_positions)
                 
+                # レコードは全ページの配置位置に順番に割り当て、足りない分はテンプレートを複製して続ける
+                sheet_count = 1
+                if total_positions > 0:
+                    sheet_count = max(1, -(-record_count // total_positions))
+                    total_pages = page_count * sheet_count
+                
                 info_text = f"出力予測: {total_pages}ページ"
                 info_text += f"\n配置位置数: {total_positions}箇所"
                 if total_positions > 0 and record_count > 0:
-                    if record_count <= total_positions:
-                        info_text += f"\n全{record_count}レコードを配置可能"
-                    else:
-                        info_text += f"\n⚠️ {record_count - total_positions}レコードが配置できません"
+                    info_text += f"\nテンプレート{sheet_count}枚分に全{record_count}レコードを配置"
             
             self.lbl_output_info.setText(info_text)
         else:
@@ -604,7 +671,12 @@ class MainWindow(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "PDFファイルを選択", "", "PDF Files (*.pdf)")
         if file_path:
             self.pdf_path = file_path
+            self.page_renderer.cancel()
             self.pdf_handler.load_pdf(file_path)
+            self.shown_preview = None
+            self.shown_page = None
+            self.view_zoom = 1.0
+            self.view_origin = (0, 0)
             self.current_page = 0
             
             self.original_page_size = self.pdf_handler.get_page_size(self.current_page)
@@ -613,51 +685,129 @@ class MainWindow(QMainWindow):
             self.update_preview()
             self.update_output_info()
     
+    def fit_zoom(self, page_num):
+        '''ページ全体がプレビューに収まる倍率'''
+        page_size = self.pdf_handler.get_page_size(page_num)
+        if not page_size:
+            return None
+        area = self.preview_label.contentsRect()
+        return min(area.width() / page_size[0], area.height() / page_size[1])
+    
+    def preview_view(self):
+        '''現在のページを描画する倍率と切り出し範囲（ページ全体なら None）'''
+        fit = self.fit_zoom(self.current_page)
+        if not fit:
+            return None
+        # 倍率と範囲を丸めてキャッシュのキーを安定させる
+        scale = round(fit * self.view_zoom, 4)
+        if self.view_zoom <= 1:
+            self.view_origin = (0, 0)
+            return scale, None
+        
+        page_width, page_height = self.pdf_handler.get_page_size(self.current_page)
+        area = self.preview_label.contentsRect()
+        visible_width = min(page_width, area.width() / scale)
+        visible_height = min(page_height, area.height() / scale)
+        x0 = round(min(max(0, self.view_origin[0]), page_width - visible_width), 1)
+        y0 = round(min(max(0, self.view_origin[1]), page_height - visible_height), 1)
+        self.view_origin = (x0, y0)
+        return scale, (x0, y0, round(x0 + visible_width, 1), round(y0 + visible_height, 1))
+    
     def update_preview(self):
         if self.pdf_path:
-            image = self.pdf_handler.get_page_image(self.current_page)
-            if image:
-                original_img_size = (image.width, image.height)
-                
-                qimage = QImage(image.tobytes(), image.width, image.height, image.width * 3, QImage.Format_RGB888)
-                pixmap = QPixmap.fromImage(qimage)
-                
-                scaled_pixmap = pixmap.scaled(self.preview_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                
-                self.current_scale = scaled_pixmap.width() / original_img_size[0]
-                
-                self.preview_label.set_base_pixmap(scaled_pixmap)
-                
-                self.restore_page_markers()
-                
-                self.lbl_page.setText(f"ページ: {self.current_page + 1}/{self.pdf_handler.get_page_count()}")
+            self.lbl_page.setText(f"ページ: {self.current_page + 1}/{self.pdf_handler.get_page_count()}")
+            
+            view = self.preview_view()
+            if not view:
+                return
+            self.view_scale, clip = view
+            
+            prefetch = []
+            for neighbour in (self.current_page + 1, self.current_page - 1):
+                if 0 <= neighbour < self.pdf_handler.get_page_count():
+                    # サイズを取得できないページは先読みしない
+                    zoom = self.fit_zoom(neighbour)
+                    if zoom:
+                        prefetch.append((neighbour, round(zoom, 4)))
+            
+            # 未描画なら低解像度版→本番の順に届き、続けて前後のページを先読みする
+            self.preview_generation = self.page_renderer.request(self.current_page, self.view_scale,
+                                                                 clip, prefetch)
+            self.shown_preview = None
+            
+            pix = self.pdf_handler.get_cached_page_pixmap(self.current_page, self.view_scale, clip)
+            if pix:
+                self.show_page_image(pix, self.view_scale)
+            elif self.shown_page != self.current_page:
+                # 前のページの画像に新しいページの配置が重ならないよう、描画が届くまで消しておく
+                self.preview_label.clear_page()
+            else:
+                # 同じページの拡大・スクロール中は古い画像を残し、座標のずれたクリックだけ止める
+                self.preview_label.mark_stale()
     
-    def restore_page_markers(self):
-        self.preview_label.clear_markers()
+    def on_page_rendered(self, generation, page_num, zoom, pix):
+        if generation != self.preview_generation or page_num != self.current_page:
+            return
+        if self.shown_preview and self.shown_preview[0] == generation and self.shown_preview[1] >= zoom:
+            return
+        self.show_page_image(pix, zoom)
+    
+    def show_page_image(self, pix, zoom):
+        # Pixmapの画素を直接参照して変換する（PIL画像やbytesを経由しない）
+        pixmap = qpixmap_from_fitz(pix)
         
-        page_positions = [pos for pos in self.barcode_positions if pos['page'] == self.current_page]
+        if zoom < self.view_scale:
+            # 低解像度版は本番と同じ大きさに引き伸ばして表示する
+            ratio = self.view_scale / zoom
+            pixmap = pixmap.scaled(round(pix.width * ratio), round(pix.height * ratio),
+                                   Qt.IgnoreAspectRatio, Qt.FastTransformation)
         
-        pdf_page_size = self.pdf_handler.get_page_size(self.current_page)
-        if not pdf_page_size:
+        self.preview_label.set_base_pixmap(pixmap)
+        self.shown_preview = (self.preview_generation, zoom)
+        self.shown_page = self.current_page
+        
+        self.restore_page_markers()
+    
+    def zoom_preview(self, steps, x, y):
+        if not self.pdf_path:
+            return
+        
+        # カーソル位置のページ座標が動かないように拡大縮小する
+        anchor_x = self.view_origin[0] + x / self.view_scale
+        anchor_y = self.view_origin[1] + y / self.view_scale
+        
+        old_zoom = self.view_zoom
+        self.view_zoom = min(self.MAX_VIEW_ZOOM, max(1.0, self.view_zoom * 1.25 ** steps))
+        if self.view_zoom == old_zoom:
             return
         
-        image = self.pdf_handler.get_page_image(self.current_page)
-        if not image:
+        new_scale = self.view_scale * self.view_zoom / old_zoom
+        self.view_origin = (anchor_x - x / new_scale, anchor_y - y / new_scale)
+        self.update_preview()
+    
+    def scroll_preview(self, dx, dy):
+        if not self.pdf_path or self.view_zoom <= 1:
             return
         
-        render_size = (image.width, image.height)
+        # ホイール1段で表示範囲の1/8だけ移動
+        area = self.preview_label.contentsRect()
+        step_x = area.width() / self.view_scale / 8 / 120
+        step_y = area.height() / self.view_scale / 8 / 120
+        self.view_origin = (self.view_origin[0] - dx * step_x, self.view_origin[1] - dy * step_y)
+        self.update_preview()
+    
+    def restore_page_markers(self):
+        self.preview_label.clear_markers()
         
-        for pos in page_positions:
-            render_x = pos['x'] * render_size[0] / pdf_page_size[0]
-            render_y = pos['y'] * render_size[1] / pdf_page_size[1]
-            
-            preview_x = render_x * self.current_scale
-            preview_y = render_y * self.current_scale
-            
-            sizes = self.QRCODE_SIZES if self.is_qrcode_mode else self.BARCODE_SIZES
-            code_width, code_height = sizes[pos['size']]
-            preview_width = code_width * self.current_scale * render_size[0] / pdf_page_size[0]
-            preview_height = code_height * self.current_scale * render_size[1] / pdf_page_size[1]
+        sizes = self.QRCODE_SIZES if self.is_qrcode_mode else self.BARCODE_SIZES
+        plan = self.pdf_handler.compile_plan(self.barcode_positions, sizes)
+        
+        origin_x, origin_y = self.view_origin
+        for placement in plan.on_page(self.current_page):
+            preview_x = (placement.x - origin_x) * self.view_scale
+            preview_y = (placement.y - origin_y) * self.view_scale
+            preview_width = placement.width * self.view_scale
+            preview_height = placement.height * self.view_scale
             
             self.preview_label.add_marker(preview_x, preview_y, preview_width, preview_height)
     
@@ -676,17 +826,11 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "先にPDFファイルを読み込んでください")
             return
         
-        render_x = x / self.current_scale
-        render_y = y / self.current_scale
-        
         pdf_page_size = self.pdf_handler.get_page_size(self.current_page)
-        image = self.pdf_handler.get_page_image(self.current_page)
         
-        if pdf_page_size and image:
-            render_size = (image.width, image.height)
-            
-            real_x = render_x * pdf_page_size[0] / render_size[0]
-            real_y = render_y * pdf_page_size[1] / render_size[1]
+        if pdf_page_size:
+            real_x = self.view_origin[0] + x / self.view_scale
+            real_y = self.view_origin[1] + y / self.view_scale
             
             self.barcode_positions.append({
                 'page': self.current_page,
@@ -697,8 +841,8 @@ class MainWindow(QMainWindow):
             
             sizes = self.QRCODE_SIZES if self.is_qrcode_mode else self.BARCODE_SIZES
             code_width, code_height = sizes[self.current_code_size]
-            preview_width = code_width * self.current_scale * render_size[0] / pdf_page_size[0]
-            preview_height = code_height * self.current_scale * render_size[1] / pdf_page_size[1]
+            preview_width = code_width * self.view_scale
+            preview_height = code_height * self.view_scale
             
             self.preview_label.add_marker(x, y, preview_width, preview_height)
             
@@ -775,6 +919,8 @@ class MainWindow(QMainWindow):
                 else:
                     QMessageBox.critical(self, "エラー", "PDF作成中にエラーが発生しました")
             else:
+                # レコードは全ページの配置位置に順番に割り当て、足りなければテンプレートを複製して続ける
+                # （ページ送りなしでは各ページが先頭のレコードから配置されるため使わない）
                 success = self.pdf_handler.add_codes_batch(
                     self.pdf_path,
                     output_path,
@@ -782,13 +928,15 @@ class MainWindow(QMainWindow):
                     self.barcode_positions,
                     generator,
                     sizes,
-                    self.is_qrcode_mode
+                    self.is_qrcode_mode,
+                    paginate=True
                 )
                 
                 if success:
+                    total_pages = self.pdf_handler.last_stats.get('pages', 0)
                     QMessageBox.information(self, "成功", 
                         f"{code_type}付きPDFを作成しました:\n{output_path}\n\n"
                         f"モード: 一括配置\n"
-                        f"総ページ数: {self.pdf_handler.get_page_count()}ページ")
+                        f"総ページ数: {total_pages}ページ")
                 else:
                     QMessageBox.critical(self, "エラー", "PDF作成中にエラーが発生しました")
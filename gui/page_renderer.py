@@ -0,0 +1,69 @@
+import threading
+from PySide6.QtCore import QThread, Signal
+
+# 先に表示する低解像度版の倍率（本番に対する比）
+DRAFT_RATIO = 0.25
+
+
+class PageRenderThread(QThread):
+    '''
+    プレビュー用のページ画像をバックグラウンドで描画する
+    要求ごとに世代番号を進め、古い世代の未処理の要求は破棄する
+    （描画中の1ページは中断できないため、完了後に結果を捨てる）
+    '''
+    page_rendered = Signal(int, int, float, object)  # 世代, ページ, 倍率, Pixmap
+    
+    def __init__(self, pdf_handler, parent=None):
+        super().__init__(parent)
+        self.pdf_handler = pdf_handler
+        self.generation = 0
+        self._jobs = []
+        self._stopping = False
+        self._cond = threading.Condition()
+    
+    def request(self, page_num, zoom, clip=None, prefetch=()):
+        '''
+        page_num を描画し、続けて prefetch の (ページ, 倍率) を先読みする
+        未描画のページはまず低解像度版を描画する。世代番号を返す
+        '''
+        jobs = []
+        if self.pdf_handler.get_cached_page_pixmap(page_num, zoom, clip) is None:
+            jobs.append((page_num, zoom * DRAFT_RATIO, clip))
+        jobs.append((page_num, zoom, clip))
+        jobs.extend((neighbour, neighbour_zoom, None) for neighbour, neighbour_zoom in prefetch)
+        
+        with self._cond:
+            self.generation += 1
+            self._jobs = jobs
+            self._cond.notify()
+            return self.generation
+    
+    def cancel(self):
+        '''未処理の要求をすべて破棄する'''
+        with self._cond:
+            self.generation += 1
+            self._jobs = []
+    
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._jobs = []
+            self._cond.notify()
+        self.wait()
+    
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                generation = self.generation
+                page_num, zoom, clip = self._jobs.pop(0)
+            
+            pix = self.pdf_handler.get_page_pixmap(page_num, zoom, clip)
+            
+            with self._cond:
+                stale = generation != self.generation
+            if pix is not None and not stale:
+                self.page_rendered.emit(generation, page_num, zoom, pix)
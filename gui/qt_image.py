@@ -0,0 +1,44 @@
+from PySide6.QtGui import QImage, QPixmap
+
+# PIL画像のモードとQImageの形式の対応（1ピクセルあたりのバイト数）
+PIL_FORMATS = {
+    'RGB': (QImage.Format_RGB888, 3),
+    'RGBA': (QImage.Format_RGBA8888, 4),
+    'L': (QImage.Format_Grayscale8, 1),
+}
+
+
+def qimage_from_fitz(pix):
+    '''
+    PyMuPDFのPixmapの画素をコピーせずに参照するQImage
+    返したQImageは pix を保持している間だけ有効（QPixmapへ変換するまで pix を破棄しないこと）
+    '''
+    if pix.alpha:
+        fmt = QImage.Format_RGBA8888
+    elif pix.n == 1:
+        fmt = QImage.Format_Grayscale8
+    else:
+        fmt = QImage.Format_RGB888
+    return QImage(pix.samples_mv, pix.width, pix.height, pix.stride, fmt)
+
+
+def qpixmap_from_fitz(pix):
+    '''Pixmapから表示用のQPixmapを作る（画素のコピーはQPixmapへの変換の1回だけ）'''
+    qimage = qimage_from_fitz(pix)
+    # fromImage が画素をコピーし終えるまで pix と qimage をこの関数内で保持する
+    return QPixmap.fromImage(qimage)
+
+
+def qpixmap_from_pil(img):
+    '''
+    PIL画像から表示用のQPixmapを作る
+    PILは内部バッファを公開しないため取り出しの1回だけコピーし、QImageはそのバッファを参照する
+    '''
+    if img.mode == '1':
+        img = img.convert('L')
+    elif img.mode not in PIL_FORMATS:
+        img = img.convert('RGB')
+    fmt, channels = PIL_FORMATS[img.mode]
+    data = img.tobytes()
+    qimage = QImage(data, img.width, img.height, img.width * channels, fmt)
+    return QPixmap.fromImage(qimage)
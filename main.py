@@ -1,9 +1,11 @@
 import sys
+import multiprocessing
 from PySide6.QtWidgets import QApplication
 from gui.main_window import MainWindow
 from version import __version__, __app_name__
 
 def main():
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     app.setApplicationName(__app_name__)
@@ -1,5 +1,5 @@
 import sys
-import os
+import multiprocessing
 from datetime import datetime
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                                QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
@@ -7,7 +7,7 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                                QDateEdit, QGroupBox, QComboBox, QSpinBox, QDialog,
                                QScrollArea)
 from PySide6.QtCore import Qt, QDate
-from PySide6.QtGui import QFont, QPixmap, QImage
+from PySide6.QtGui import QFont
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
@@ -28,9 +28,22 @@ from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
-import tempfile
+from PIL import Image, ImageDraw
+
+from core import qr_raster
+from core.qr_encoder import default_qr_encoder
+from core.code128_encoder import default_encoder
+from core.font_registry import latin_fonts
+from core.xobject_pool import ImageXObjectPool
+from core.parallel import default_workers, split_shards, run_sharded
+from core.render_pipeline import RenderPipeline, default_render_workers
+from core.pdf_compaction import compaction_options, compact_pdf
+from core.image_encoding import CodeImageEncoder
+from core.code_image import GenerationBatch, generate_batch, to_image_mode
+from gui.qt_image import qpixmap_from_pil
+
+# これ未満のページ数ではプロセス起動のコストが上回るため並列化しない
+PARALLEL_MIN_PAGES = 20
 
 
 class PreviewDialog(QDialog):
@@ -39,6 +52,8 @@ class PreviewDialog(QDialog):
         self.setWindowTitle("プレビュー")
         self.setGeometry(100, 100, 900, 700)
         self.preview_images = preview_images
+        # 変換済みのQPixmap（ページを行き来しても変換し直さない）
+        self.pixmaps = {}
         self.current_page = 0
         
         layout = QVBoxLayout(self)
@@ -71,9 +86,11 @@ class PreviewDialog(QDialog):
     
     def update_display(self):
         if self.preview_images:
-            img = self.preview_images[self.current_page]
-            qimg = QImage(img.tobytes(), img.width, img.height, img.width * 3, QImage.Format_RGB888)
-            self.img_label.setPixmap(QPixmap.fromImage(qimg))
+            pixmap = self.pixmaps.get(self.current_page)
+            if pixmap is None:
+                pixmap = qpixmap_from_pil(self.preview_images[self.current_page])
+                self.pixmaps[self.current_page] = pixmap
+            self.img_label.setPixmap(pixmap)
             self.page_label.setText(f"{self.current_page + 1} / {len(self.preview_images)}")
         self.prev_btn.setEnabled(self.current_page > 0)
         self.next_btn.setEnabled(self.current_page < len(self.preview_images) - 1)
@@ -89,7 +106,296 @@ class PreviewDialog(QDialog):
             self.update_display()
 
 
-class BarcodeApp(QMainWindow):
+class SheetCodeBatch(GenerationBatch):
+    """SheetRenderer.generate_many 1回分（サイズは倍率）"""
+    
+    font_registry = latin_fonts
+    
+    def generate(self, code, display_text, scale):
+        if self.generator.code_type == "barcode":
+            return self.generator.gen_barcode(code, scale, display_text, self)
+        return self.generator.gen_qr(code, scale)
+
+
+class SheetRenderer:
+    """台紙PDFの描画処理（Qtに依存しないため並列実行時のワーカーでも使う）"""
+    
+    SETTINGS = ('code_type', 'font_size', 'creation_date', 'center_margin', 'page_margin', 'image_encoding',
+                'code_mode')
+    # QRコードのエンコーダー（高速モードにする場合は QREncoder(fast=True, mask_pattern='cached') に差し替える）
+    qr_encoder = default_qr_encoder
+    
+    @classmethod
+    def from_settings(cls, settings):
+        renderer = cls()
+        for key, value in settings.items():
+            setattr(renderer, key, value)
+        renderer.pdf_workers = 1
+        renderer.render_workers = 1
+        register_pdf_fonts()
+        return renderer
+    
+    def sheet_settings(self):
+        return {key: getattr(self, key) for key in self.SETTINGS}
+    
+    def render_pipeline(self):
+        return RenderPipeline(getattr(self, 'render_workers', 1), getattr(self, 'render_queue_size', None))
+    
+    def code_encoder(self):
+        return CodeImageEncoder(getattr(self, 'image_encoding', 'rgb'))
+    
+    def generate_many(self, records, pipeline=None, transform=None):
+        """
+        (コード, 表示テキスト, 倍率) の列からコード画像を入力順に生成する
+        バッチ内ではフォントと文字幅の計測用の描画先を共有する
+        """
+        return generate_batch(SheetCodeBatch(self, transform), records, pipeline)
+    
+    def code_image_mode(self):
+        """コード画像の画素形式（'RGB' / 'L' / '1'）"""
+        return getattr(self, 'code_mode', 'RGB')
+    
+    def _get_font(self, size):
+        return latin_fonts.get_font(max(8, int(size)))
+    
+    def _render_bars(self, code, scale):
+        """
+        キャッシュ済みのモジュール列をImageWriterで描画
+        Code128の符号化とPNGの書き出し・読み込みを省き、寸法・余白はImageWriterのまま
+        """
+        options = dict(Code128.default_writer_options)
+        options.update({
+            'module_width': 0.3 * scale,
+            'module_height': 12 * scale,
+            'font_size': 0,
+            'text_distance': 1,
+            'quiet_zone': 2,
+            'write_text': False,
+        })
+        writer = ImageWriter(mode=self.code_image_mode())
+        writer.set_options(options)
+        return writer.render([default_encoder.encode(str(code))])
+    
+    def gen_barcode(self, code, scale=1.0, text=None, batch=None):
+        try:
+            img = self._render_bars(code, scale)
+            
+            # テキスト追加
+            text = str(code) if text is None else text
+            font_size = max(8, int(self.font_size * scale))
+            font = batch.font(font_size) if batch else self._get_font(font_size)
+            
+            w, h = img.size
+            try:
+                if batch:
+                    tmp = batch.scratch('measure', lambda: ImageDraw.Draw(Image.new('L', (1, 1))))
+                else:
+                    tmp = ImageDraw.Draw(Image.new('L', (1, 1)))
+                bb = tmp.textbbox((0, 0), text, font=font)
+                tw, th = bb[2] - bb[0], bb[3] - bb[1]
+            except:
+                tw, th = len(text) * 6, 10
+            
+            new = Image.new(img.mode, (w, h + th + 3), 'white')
+            new.paste(img, (0, 0))
+            d = ImageDraw.Draw(new)
+            try:
+                d.text(((w - tw) / 2, h + 1), text, fill='black', font=font)
+            except:
+                d.text(((w - tw) / 2, h + 1), text, fill='black')
+            return new
+        except Exception as e:
+            print(f"BC error: {e}")
+            return None
+    
+    def gen_qr(self, code, scale=1.0):
+        try:
+            box_size = max(2, int(5 * scale))
+            if qr_raster.is_available():
+                # キャッシュ済みのモジュール行列をmake_imageと同じ寸法で直接描画
+                matrix = self.qr_encoder.matrix(code)
+                size = (len(matrix) + 2) * box_size
+                return to_image_mode(Image.fromarray(qr_raster.render_modules(matrix, size, 1), 'L'),
+                                     self.code_image_mode())
+            
+            qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L,
+                               box_size=box_size, border=1)
+            qr.add_data(str(code))
+            qr.make(fit=True)
+            img = qr.make_image(fill_color="black", back_color="white")
+            return to_image_mode(img, self.code_image_mode()) if hasattr(img, 'convert') else img
+        except Exception as e:
+            print(f"QR error: {e}")
+            return None
+    
+    def _write_eq_pages(self, path, pages, first_pn=1):
+        """割り付け済みの備品ページをPDFに書き出す"""
+        c = canvas.Canvas(path, pagesize=A4)
+        w, h = A4
+        margin = self.page_margin
+        hdr_h = 28
+        cx, cy = w / 2, h / 2
+        
+        ct = "BC" if self.code_type == "barcode" else "QR"
+        # 同じ内容のコード画像は1回だけ埋め込む
+        encoder = self.code_encoder()
+        images = ImageXObjectPool(encoder)
+        
+        def header(pn):
+            try:
+                c.setFont("HeiseiMin-W3", 8)
+            except:
+                c.setFont("Helvetica", 8)
+            c.drawString(margin, h - 12, f"備品用{ct}台紙 {self.creation_date.strftime('%Y/%m/%d')} P.{pn}")
+            c.line(margin, h - 18, w - margin, h - 18)
+            c.setStrokeColorRGB(0.93, 0.93, 0.93)
+            c.line(cx, margin, cx, h - hdr_h)
+            c.line(margin, cy, w - margin, cy)
+            c.setStrokeColorRGB(0, 0, 0)
+        
+        # 白黒への変換は生成スレッド側で行う
+        rendered = self.generate_many(
+            ((item['code'], str(item['code']), 0.5 + item['size'] * 0.12) for placed in pages for item, p in placed),
+            self.render_pipeline(), lambda img, scale: encoder.prepare(img)
+        )
+        
+        for offset, placed in enumerate(pages):
+            if offset > 0:
+                c.showPage()
+            header(first_pn + offset)
+            
+            for item, p in placed:
+                code_img = next(rendered)
+                px, py = p['x'], p['y']
+                pw, ph = p['w'], p['h']
+                
+                c.setStrokeColorRGB(0.67, 0.67, 0.67)
+                c.rect(px, py - ph, pw, ph)
+                c.setStrokeColorRGB(0, 0, 0)
+                
+                try:
+                    c.setFont("HeiseiMin-W3", 6)
+                except:
+                    c.setFont("Helvetica", 6)
+                c.drawString(px + 2, py - 8, item['name'][:int(pw / 6)])
+                
+                if self.code_type == "barcode":
+                    if code_img:
+                        iw = min(pw - 4, code_img.width)
+                        ih = min(ph - 10, code_img.height)
+                        ix = px + (pw - iw) / 2
+                        iy = py - ph + 2
+                else:
+                    if code_img:
+                        sz = min(pw - 4, ph - 10)
+                        iw = ih = sz
+                        ix = px + (pw - sz) / 2
+                        iy = py - ph + 2
+                
+                if code_img:
+                    # 一時ファイルを介さずメモリ上の画像をそのまま渡す
+                    images.draw_on_canvas(c, code_img, ix, iy, iw, ih, mask='auto')
+        
+        c.save()
+    
+    def _write_tc_pages(self, path, pages, first_pn=1):
+        """割り付け済みの教員ページをPDFに書き出す"""
+        c = canvas.Canvas(path, pagesize=A4)
+        w, h = A4
+        margin = self.page_margin
+        hdr_h = 28
+        cx, cy = w / 2, h / 2
+        
+        ct = "BC" if self.code_type == "barcode" else "QR"
+        row_h = 30 if self.code_type == "barcode" else 35
+        # 同じ内容のコード画像は1回だけ埋め込む
+        encoder = self.code_encoder()
+        images = ImageXObjectPool(encoder)
+        
+        def header(pn):
+            try:
+                c.setFont("HeiseiMin-W3", 8)
+            except:
+                c.setFont("Helvetica", 8)
+            c.drawString(margin, h - 12, f"教員用{ct}台紙 {self.creation_date.strftime('%Y/%m/%d')} P.{pn}")
+            c.line(margin, h - 18, w - margin, h - 18)
+            c.setStrokeColorRGB(0.93, 0.93, 0.93)
+            c.line(cx, margin, cx, h - hdr_h)
+            c.line(margin, cy, w - margin, cy)
+            c.setStrokeColorRGB(0, 0, 0)
+        
+        scale = 0.52 if self.code_type == "barcode" else 0.48
+        # 白黒への変換は生成スレッド側で行う
+        rendered = self.generate_many(
+            ((item['code'], str(item['code']), scale) for placed in pages for item, p in placed),
+            self.render_pipeline(), lambda img, scale: encoder.prepare(img)
+        )
+        
+        for offset, placed in enumerate(pages):
+            if offset > 0:
+                c.showPage()
+            header(first_pn + offset)
+            
+            for item, p in placed:
+                code_img = next(rendered)
+                px, py = p['x'], p['y']
+                
+                try:
+                    c.setFont("HeiseiMin-W3", 7)
+                except:
+                    c.setFont("Helvetica", 7)
+                c.drawString(px + 2, py - 10, item['name'][:10])
+                
+                if self.code_type == "barcode":
+                    iw, ih = 85, 24
+                    ix = px + 62
+                else:
+                    iw = ih = 26
+                    ix = px + 78
+                
+                if code_img:
+                    # 一時ファイルを介さずメモリ上の画像をそのまま渡す
+                    images.draw_on_canvas(c, code_img, ix, py - row_h + 3, iw, ih, mask='auto')
+        
+        c.save()
+    
+    def write_sheet_pdf(self, kind, path, pages):
+        """割り付け済みページを書き出す（ページ数が多い場合はプロセス並列）"""
+        workers = getattr(self, 'pdf_workers', 1)
+        compaction = getattr(self, 'pdf_compaction', 'none')
+        if workers > 1 and len(pages) >= PARALLEL_MIN_PAGES:
+            settings = self.sheet_settings()
+            # 連結時にまとめて圧縮する
+            run_sharded(
+                _write_sheet_shard, path, split_shards(pages, workers),
+                lambda part_path, start, shard: (settings, kind, part_path, shard, start + 1),
+                workers, save_options=compaction_options(compaction)
+            )
+        else:
+            self.write_sheet_pages(kind, path, pages)
+            compact_pdf(path, compaction)
+    
+    def write_sheet_pages(self, kind, path, pages, first_pn=1):
+        if kind == 'eq':
+            self._write_eq_pages(path, pages, first_pn)
+        else:
+            self._write_tc_pages(path, pages, first_pn)
+
+
+def register_pdf_fonts():
+    try:
+        pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
+    except:
+        pass
+
+
+def _write_sheet_shard(task):
+    """並列実行時のワーカー: ページ範囲1つ分を部分PDFに書き出す"""
+    settings, kind, part_path, pages, first_pn = task
+    SheetRenderer.from_settings(settings).write_sheet_pages(kind, part_path, pages, first_pn)
+
+
+class BarcodeApp(QMainWindow, SheetRenderer):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("バーコード管理システム")
@@ -104,43 +410,22 @@ class BarcodeApp(QMainWindow):
         self.center_margin = 4
         self.page_margin = 8
         
-        self._font_path = None
-        self._init_fonts()
+        # 台紙PDFをプロセス並列で書き出すときのワーカー数
+        self.pdf_workers = default_workers()
+        # コード画像を先行生成するスレッド数（PDFの書き込みは1スレッド）
+        self.render_workers = default_render_workers()
+        # 台紙PDFの圧縮プリセット（core.pdf_compaction、'none' は従来どおりの保存）
+        self.pdf_compaction = 'none'
+        # コード画像の埋め込み方式（core.image_encoding）
+        # 台紙の表示テキストは小さく、閾値で白黒にすると潰れるため従来どおりの 'rgb' で埋め込む
+        self.image_encoding = 'rgb'
+        # コード画像はグレースケールで合成する（RGBと同じ画素値で、プレビューでも縮小するため1ビットにはしない）
+        self.code_mode = 'L'
         
-        try:
-            pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
-        except:
-            pass
+        register_pdf_fonts()
         
         self.init_ui()
     
-    def _init_fonts(self):
-        paths = [
-            "/System/Library/Fonts/Helvetica.ttc",
-            "/System/Library/Fonts/HelveticaNeue.ttc",
-            "/Library/Fonts/Arial.ttf",
-            "/System/Library/Fonts/Supplemental/Arial.ttf",
-            "C:/Windows/Fonts/arial.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        ]
-        for p in paths:
-            if os.path.exists(p):
-                try:
-                    ImageFont.truetype(p, 12)
-                    self._font_path = p
-                    return
-                except:
-                    pass
-    
-    def _get_font(self, size):
-        size = max(8, int(size))
-        if self._font_path:
-            try:
-                return ImageFont.truetype(self._font_path, size)
-            except:
-                pass
-        return ImageFont.load_default()
-    
     def init_ui(self):
         central = QWidget()
         self.setCentralWidget(central)
@@ -437,57 +722,6 @@ class BarcodeApp(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "エラー", str(e))
     
-    def gen_barcode(self, code, scale=1.0):
-        try:
-            bc = Code128(str(code), writer=ImageWriter())
-            buf = BytesIO()
-            bc.write(buf, {
-                'module_width': 0.3 * scale,
-                'module_height': 12 * scale,
-                'font_size': 0,
-                'text_distance': 1,
-                'quiet_zone': 2,
-                'write_text': False,
-            })
-            buf.seek(0)
-            img = Image.open(buf).convert('RGB')
-            
-            # テキスト追加
-            text = str(code)
-            font = self._get_font(max(8, int(self.font_size * scale)))
-            
-            w, h = img.size
-            try:
-                tmp = ImageDraw.Draw(Image.new('RGB', (1, 1)))
-                bb = tmp.textbbox((0, 0), text, font=font)
-                tw, th = bb[2] - bb[0], bb[3] - bb[1]
-            except:
-                tw, th = len(text) * 6, 10
-            
-            new = Image.new('RGB', (w, h + th + 3), 'white')
-            new.paste(img, (0, 0))
-            d = ImageDraw.Draw(new)
-            try:
-                d.text(((w - tw) / 2, h + 1), text, fill='black', font=font)
-            except:
-                d.text(((w - tw) / 2, h + 1), text, fill='black')
-            return new
-        except Exception as e:
-            print(f"BC error: {e}")
-            return None
-    
-    def gen_qr(self, code, scale=1.0):
-        try:
-            qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L,
-                               box_size=max(2, int(5 * scale)), border=1)
-            qr.add_data(str(code))
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-            return img.convert('RGB') if hasattr(img, 'convert') else img
-        except Exception as e:
-            print(f"QR error: {e}")
-            return None
-    
     def create_eq_pages(self):
         if not self.equipment_data:
             return []
@@ -501,6 +735,12 @@ class BarcodeApp(QMainWindow):
         title_font = self._get_font(9)
         text_font = self._get_font(7)
         
+        # 項目は先頭から順に1回ずつ配置されるため、コード画像もその順にまとめて先行生成する
+        rendered = self.generate_many(
+            ((item['code'], str(item['code']), 0.5 + item['size'] * 0.12) for item in self.equipment_data),
+            self.render_pipeline()
+        )
+        
         idx = 0
         pnum = 0
         
@@ -552,16 +792,14 @@ class BarcodeApp(QMainWindow):
                 except:
                     draw.text((x + 2, y + 1), name, fill='black')
                 
-                scale = 0.5 + item['size'] * 0.12
+                code_img = next(rendered)
                 if self.code_type == "barcode":
-                    code_img = self.gen_barcode(item['code'], scale)
                     if code_img:
                         cw = min(int(w - 4), code_img.width)
                         ch = min(int(h - 12), code_img.height)
                         code_img = code_img.resize((cw, ch), Image.Resampling.LANCZOS)
                         img.paste(code_img, (int(x + (w - cw) / 2), int(y + 10)))
                 else:
-                    code_img = self.gen_qr(item['code'], scale)
                     if code_img:
                         sz = min(int(w - 4), int(h - 12))
                         code_img = code_img.resize((sz, sz), Image.Resampling.LANCZOS)
@@ -615,6 +853,12 @@ class BarcodeApp(QMainWindow):
         
         per_page = len(positions)
         
+        scale = 0.5 if self.code_type == "barcode" else 0.45
+        rendered = self.generate_many(
+            ((item['code'], str(item['code']), scale) for item in self.teacher_data),
+            self.render_pipeline()
+        )
+        
         for start in range(0, len(self.teacher_data), per_page):
             pnum = start // per_page + 1
             img = Image.new('RGB', (pw, ph), 'white')
@@ -631,8 +875,6 @@ class BarcodeApp(QMainWindow):
             
             items = self.teacher_data[start:start + per_page]
             for i, item in enumerate(items):
-                if i >= len(positions):
-                    break
                 p = positions[i]
                 x, y = p['x'], ph - p['y']
                 
@@ -641,13 +883,12 @@ class BarcodeApp(QMainWindow):
                 except:
                     draw.text((x + 2, y + 3), item['name'][:8], fill='black')
                 
+                code_img = next(rendered)
                 if self.code_type == "barcode":
-                    code_img = self.gen_barcode(item['code'], 0.5)
                     if code_img:
                         code_img = code_img.resize((80, 24), Image.Resampling.LANCZOS)
                         img.paste(code_img, (int(x + 62), int(y + 2)))
                 else:
-                    code_img = self.gen_qr(item['code'], 0.45)
                     if code_img:
                         code_img = code_img.resize((28, 28), Image.Resampling.LANCZOS)
                         img.paste(code_img, (int(x + 75), int(y + 2)))
@@ -683,32 +924,15 @@ class BarcodeApp(QMainWindow):
             import traceback
             QMessageBox.critical(self, "エラー", traceback.format_exc())
     
-    def create_eq_pdf(self, path):
-        c = canvas.Canvas(path, pagesize=A4)
-        w, h = A4
+    def paginate_eq(self, w, h):
+        """備品データをページごとの (項目, セル位置) のリストに割り付ける"""
         margin = self.page_margin
         hdr_h = 28
-        cx, cy = w / 2, h / 2
-        
-        ct = "BC" if self.code_type == "barcode" else "QR"
-        
-        def header(pn):
-            try:
-                c.setFont("HeiseiMin-W3", 8)
-            except:
-                c.setFont("Helvetica", 8)
-            c.drawString(margin, h - 12, f"備品用{ct}台紙 {self.creation_date.strftime('%Y/%m/%d')} P.{pn}")
-            c.line(margin, h - 18, w - margin, h - 18)
-            c.setStrokeColorRGB(0.93, 0.93, 0.93)
-            c.line(cx, margin, cx, h - hdr_h)
-            c.line(margin, cy, w - margin, cy)
-            c.setStrokeColorRGB(0, 0, 0)
-        
-        pn = 1
-        header(pn)
+        pages = []
         
         idx = 0
         while idx < len(self.equipment_data):
+            placed = []
             cur_size = self.equipment_data[idx]['size']
             cols = self.get_columns(cur_size)
             cell_h = self.get_cell_height(cur_size)
@@ -730,58 +954,17 @@ class BarcodeApp(QMainWindow):
                     if not positions:
                         break
                 
-                p = positions[pi]
-                px, py = p['x'], p['y']
-                pw, ph = p['w'], p['h']
-                
-                c.setStrokeColorRGB(0.67, 0.67, 0.67)
-                c.rect(px, py - ph, pw, ph)
-                c.setStrokeColorRGB(0, 0, 0)
-                
-                try:
-                    c.setFont("HeiseiMin-W3", 6)
-                except:
-                    c.setFont("Helvetica", 6)
-                c.drawString(px + 2, py - 8, item['name'][:int(pw / 6)])
-                
-                scale = 0.5 + item['size'] * 0.12
-                if self.code_type == "barcode":
-                    code_img = self.gen_barcode(item['code'], scale)
-                    if code_img:
-                        iw = min(pw - 4, code_img.width)
-                        ih = min(ph - 10, code_img.height)
-                        ix = px + (pw - iw) / 2
-                        iy = py - ph + 2
-                else:
-                    code_img = self.gen_qr(item['code'], scale)
-                    if code_img:
-                        sz = min(pw - 4, ph - 10)
-                        iw = ih = sz
-                        ix = px + (pw - sz) / 2
-                        iy = py - ph + 2
-                
-                if code_img:
-                    # Windowsでの権限エラーを回避するため、tempfileを明示的に管理
-                    fd, temp_path = tempfile.mkstemp(suffix='.png')
-                    try:
-                        os.close(fd)  # ファイルハンドルを閉じる
-                        code_img.save(temp_path)
-                        c.drawImage(temp_path, ix, iy, width=iw, height=ih, mask='auto')
-                    finally:
-                        try:
-                            os.unlink(temp_path)
-                        except:
-                            pass  # 削除失敗しても続行
-                
+                placed.append((item, positions[pi]))
                 idx += 1
                 pi += 1
             
-            if idx < len(self.equipment_data):
-                c.showPage()
-                pn += 1
-                header(pn)
+            pages.append(placed)
         
-        c.save()
+        return pages
+    
+    def create_eq_pdf(self, path):
+        w, h = A4
+        self.write_sheet_pdf('eq', path, self.paginate_eq(w, h))
     
     def print_teacher(self):
         if not self.teacher_data:
@@ -798,17 +981,14 @@ class BarcodeApp(QMainWindow):
             import traceback
             QMessageBox.critical(self, "エラー", traceback.format_exc())
     
-    def create_tc_pdf(self, path):
-        c = canvas.Canvas(path, pagesize=A4)
-        w, h = A4
+    def paginate_tc(self, w, h):
+        """教員データをページごとの (項目, 位置) のリストに割り付ける"""
         margin = self.page_margin
         hdr_h = 28
-        cx, cy = w / 2, h / 2
+        cy = h / 2
+        cx = w / 2
         cm = self.center_margin
-        
-        ct = "BC" if self.code_type == "barcode" else "QR"
         row_h = 30 if self.code_type == "barcode" else 35
-        col_w = cx - margin - cm
         
         positions = []
         y = h - margin - hdr_h
@@ -821,62 +1001,12 @@ class BarcodeApp(QMainWindow):
             y -= row_h
         
         per_page = len(positions)
-        pn = 0
-        
-        def header(pn):
-            try:
-                c.setFont("HeiseiMin-W3", 8)
-            except:
-                c.setFont("Helvetica", 8)
-            c.drawString(margin, h - 12, f"教員用{ct}台紙 {self.creation_date.strftime('%Y/%m/%d')} P.{pn}")
-            c.line(margin, h - 18, w - margin, h - 18)
-            c.setStrokeColorRGB(0.93, 0.93, 0.93)
-            c.line(cx, margin, cx, h - hdr_h)
-            c.line(margin, cy, w - margin, cy)
-            c.setStrokeColorRGB(0, 0, 0)
-        
-        for start in range(0, len(self.teacher_data), per_page):
-            if start > 0:
-                c.showPage()
-            pn += 1
-            header(pn)
-            
-            items = self.teacher_data[start:start + per_page]
-            for i, item in enumerate(items):
-                if i >= len(positions):
-                    break
-                p = positions[i]
-                px, py = p['x'], p['y']
-                
-                try:
-                    c.setFont("HeiseiMin-W3", 7)
-                except:
-                    c.setFont("Helvetica", 7)
-                c.drawString(px + 2, py - 10, item['name'][:10])
-                
-                if self.code_type == "barcode":
-                    code_img = self.gen_barcode(item['code'], 0.52)
-                    iw, ih = 85, 24
-                    ix = px + 62
-                else:
-                    code_img = self.gen_qr(item['code'], 0.48)
-                    iw = ih = 26
-                    ix = px + 78
-                
-                if code_img:
-                    # Windowsでの権限エラーを回避するため、tempfileを明示的に管理
-                    fd, temp_path = tempfile.mkstemp(suffix='.png')
-                    try:
-                        os.close(fd)  # ファイルハンドルを閉じる
-                        code_img.save(temp_path)
-                        c.drawImage(temp_path, ix, py - row_h + 3, width=iw, height=ih, mask='auto')
-                    finally:
-                        try:
-                            os.unlink(temp_path)
-                        except:
-                            pass  # 削除失敗しても続行
-        
-        c.save()
+        return [list(zip(self.teacher_data[start:start + per_page], positions))
+                for start in range(0, len(self.teacher_data), per_page)]
+    
+    def create_tc_pdf(self, path):
+        w, h = A4
+        self.write_sheet_pdf('tc', path, self.paginate_tc(w, h))
     
     def clear_data(self):
         if QMessageBox.question(self, "確認", "クリアしますか?") == QMessageBox.Yes:
@@ -887,6 +1017,7 @@ class BarcodeApp(QMainWindow):
 
 
 def main():
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     BarcodeApp().show()
     sys.exit(app.exec())
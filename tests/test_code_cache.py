@@ -0,0 +1,66 @@
+from PIL import Image
+
+from core.code_cache import RenderedCodeCache
+
+
+def image(width=10, height=10, color='black'):
+    return Image.new('L', (width, height), color)
+
+
+def test_key_depends_on_every_input():
+    key = RenderedCodeCache.make_key('code128', 'R1', 'N1', (150, 80), {'dpi': 300})
+    
+    assert key == RenderedCodeCache.make_key('code128', 'R1', 'N1', (150, 80), {'dpi': 300})
+    assert key != RenderedCodeCache.make_key('qrcode', 'R1', 'N1', (150, 80), {'dpi': 300})
+    assert key != RenderedCodeCache.make_key('code128', 'R2', 'N1', (150, 80), {'dpi': 300})
+    assert key != RenderedCodeCache.make_key('code128', 'R1', 'N2', (150, 80), {'dpi': 300})
+    assert key != RenderedCodeCache.make_key('code128', 'R1', 'N1', (151, 80), {'dpi': 300})
+    assert key != RenderedCodeCache.make_key('code128', 'R1', 'N1', (150, 80), {'dpi': 600})
+
+
+def test_memory_cache_evicts_least_recently_used_by_bytes():
+    cache = RenderedCodeCache(max_bytes=250)
+    cache.put('a', image())
+    cache.put('b', image())
+    assert cache.get('a') is not None
+    cache.put('c', image())
+    
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.stats()['bytes'] == 200
+
+
+def test_memory_only_cache_writes_nothing_to_disk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = RenderedCodeCache()
+    cache.put('a', image())
+    
+    assert list(tmp_path.iterdir()) == []
+    assert cache.stats()['disk_bytes'] == 0
+
+
+def test_disk_cache_is_shared_between_instances(tmp_path):
+    key = RenderedCodeCache.make_key('code128', 'R1', 'N1', (150, 80))
+    RenderedCodeCache(cache_dir=str(tmp_path)).put(key, image(color='white'))
+    
+    cache = RenderedCodeCache(cache_dir=str(tmp_path))
+    stored = cache.get(key)
+    
+    assert stored.getpixel((0, 0)) == 255
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_disk_cache_stays_under_its_limit(tmp_path):
+    cache = RenderedCodeCache(cache_dir=str(tmp_path), max_disk_bytes=300)
+    keys = [RenderedCodeCache.make_key('code128', f'R{i}', '', (10, 10)) for i in range(10)]
+    for key in keys:
+        cache.put(key, image(40, 40))
+    
+    files = list(tmp_path.rglob('*.png'))
+    assert 0 < len(files) < len(keys)
+    assert sum(path.stat().st_size for path in files) == cache.stats()['disk_bytes'] <= 300
+    # 新しいものが残る
+    cache.clear()
+    assert cache.get(keys[-1]) is not None
+    assert cache.get(keys[0]) is None
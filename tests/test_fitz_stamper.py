@@ -0,0 +1,58 @@
+import fitz
+
+from core.barcode_generator import BarcodeGenerator
+from core.fitz_stamper import FitzStamper
+from core.pdf_handler import PDFHandler
+
+SIZES = {'M': (150, 80)}
+
+
+def make_template(path, blank_pages=()):
+    '''blank_pages に指定したページは内容のない白紙にする'''
+    doc = fitz.open()
+    for number in range(2):
+        page = doc.new_page()
+        if number not in blank_pages:
+            page.insert_text((72, 72), f"Template page {number + 1}", fontsize=20)
+    doc.save(path)
+
+
+def records(count):
+    return [{'barcode': f'R{i:06d}', 'name': f'N{i:06d}'} for i in range(count)]
+
+
+def test_continuous_xobject_mode_copies_blank_template_pages(tmp_path):
+    template = str(tmp_path / 'template.pdf')
+    output = str(tmp_path / 'output.pdf')
+    make_template(template, blank_pages=(0,))
+    positions = [{'page': 0, 'x': 50, 'y': 100, 'size': 'M'}, {'page': 1, 'x': 50, 'y': 400, 'size': 'M'}]
+    
+    FitzStamper(template_mode='xobject').add_codes_continuous(
+        template, output, records(3), positions, BarcodeGenerator(), SIZES)
+    
+    doc = fitz.open(output)
+    assert doc.page_count == 6
+    for page in doc:
+        assert len(page.get_images()) == 1
+    assert 'Template page 2' in doc[1].get_text()
+
+
+def test_paginated_batch_keeps_blank_pages_and_annotations(tmp_path):
+    template = str(tmp_path / 'template.pdf')
+    output = str(tmp_path / 'output.pdf')
+    make_template(template, blank_pages=(1,))
+    doc = fitz.open(template)
+    doc[0].add_text_annot((300, 300), "note")
+    doc.saveIncr()
+    doc.close()
+    positions = [{'page': 0, 'x': 50, 'y': 100, 'size': 'M'}, {'page': 1, 'x': 50, 'y': 400, 'size': 'M'}]
+    
+    handler = PDFHandler()
+    assert handler.add_codes_batch(template, output, records(5), positions, BarcodeGenerator(), SIZES,
+                                   paginate=True)
+    
+    doc = fitz.open(output)
+    # 配置位置2つに5件なので、テンプレート3枚分
+    assert doc.page_count == 6
+    assert [len(page.get_images()) for page in doc] == [1, 1, 1, 1, 1, 0]
+    assert [len(list(page.annots())) for page in doc] == [1, 0, 1, 0, 1, 0]
@@ -0,0 +1,83 @@
+import fitz
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from core.barcode_generator import BarcodeGenerator
+from core.code_image import to_bilevel
+from core.image_encoding import CodeImageEncoder, EncodedImage, encode_flate, encode_g4
+from core.pdf_handler import PDFHandler
+
+
+def sample_image():
+    '''幅が8の倍数でない白黒の画像（行末の詰め方も確認する）'''
+    img = Image.new('L', (101, 37), 'white')
+    draw = ImageDraw.Draw(img)
+    for x in range(3, 95, 7):
+        draw.rectangle((x, 2, x + 2, 30), fill='black')
+    draw.text((5, 25), "G4", fill='black')
+    return to_bilevel(img)
+
+
+def decoded_pixels(encoded):
+    '''PDFの画像XObjectとして埋め込み、MuPDFで復号した画素（0=黒）を返す'''
+    doc = fitz.open()
+    page = doc.new_page()
+    xref = CodeImageEncoder('balanced')._add_encoded_image(doc, encoded)
+    page.insert_image(page.rect, xref=xref)
+    pix = fitz.Pixmap(doc, xref)
+    return np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width) > 127
+
+
+@pytest.mark.parametrize('codec', ['flate', 'g4'])
+def test_encoded_bilevel_image_round_trips(codec):
+    img = sample_image()
+    if codec == 'g4':
+        data, inverted = encode_g4(img)
+        encoded = EncodedImage(img.width, img.height, data, 'CCITTFaxDecode',
+                               {'K': -1, 'Columns': img.width, 'Rows': img.height}, inverted)
+    else:
+        encoded = EncodedImage(img.width, img.height, encode_flate(img), 'FlateDecode')
+    
+    assert (decoded_pixels(encoded) == np.array(img)).all()
+
+
+def test_smallest_preset_picks_the_smaller_codec():
+    img = sample_image()
+    
+    encoded = CodeImageEncoder('smallest').encode(img)
+    
+    assert len(encoded.data) <= min(len(encode_flate(img, 9)), len(encode_g4(img)[0]))
+    assert (decoded_pixels(encoded) == np.array(img)).all()
+
+
+def render_output(tmp_path, engine, image_encoding):
+    template = str(tmp_path / 'template.pdf')
+    output = str(tmp_path / f'{engine}_{image_encoding}.pdf')
+    doc = fitz.open()
+    doc.new_page()
+    doc.save(template)
+    data = [{'barcode': 'R000123', 'name': 'N000123'}]
+    positions = [{'page': 0, 'x': 50, 'y': 100, 'size': 'M'}]
+    handler = PDFHandler(engine=engine, image_encoding=image_encoding)
+    assert handler.add_codes_batch(template, output, data, positions, BarcodeGenerator(dpi=300), {'M': (150, 80)})
+    rendered = fitz.open(output)
+    pix = rendered[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    return np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width) < 128
+
+
+@pytest.mark.parametrize('image_encoding', ['rgb', 'balanced', 'smallest'])
+def test_engines_place_codes_identically(tmp_path, image_encoding):
+    pypdf2 = render_output(tmp_path, 'pypdf2', image_encoding)
+    fitz_engine = render_output(tmp_path, 'fitz', image_encoding)
+    
+    assert pypdf2.any()
+    assert (pypdf2 != fitz_engine).sum() <= pypdf2.sum() * 0.01
+
+
+def test_bilevel_encoding_keeps_the_rgb_output(tmp_path):
+    rgb = render_output(tmp_path, 'fitz', 'rgb')
+    bilevel = render_output(tmp_path, 'fitz', 'balanced')
+    
+    # 白黒にしても変わるのは文字の縁のわずかな画素だけ
+    assert (rgb != bilevel).sum() <= rgb.sum() * 0.01
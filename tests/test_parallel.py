@@ -0,0 +1,40 @@
+import fitz
+import pytest
+
+from core.parallel import concatenate_pdfs, split_shards
+
+
+@pytest.mark.parametrize('count, workers', [(1, 4), (7, 2), (50, 3), (101, 8)])
+def test_shards_cover_items_in_order(count, workers):
+    items = list(range(count))
+    
+    shards = split_shards(items, workers)
+    
+    assert [item for _, shard in shards for item in shard] == items
+    assert all(shard[0] == start for start, shard in shards)
+    assert len(shards) <= workers * 4
+    assert all(shards)
+
+
+def test_no_shards_for_no_items():
+    assert split_shards([], 4) == []
+
+
+def test_parts_are_concatenated_in_shard_order(tmp_path):
+    part_paths = []
+    for part in range(3):
+        doc = fitz.open()
+        for number in range(2):
+            doc.new_page().insert_text((72, 72), f"part {part} page {number}")
+        path = str(tmp_path / f'part_{part}.pdf')
+        doc.save(path)
+        part_paths.append(path)
+    output = str(tmp_path / 'output.pdf')
+    
+    stats = concatenate_pdfs(part_paths, output, chunk_pages=2)
+    
+    doc = fitz.open(output)
+    assert stats['pages'] == 6
+    assert [page.get_text().strip() for page in doc] == [
+        f"part {part} page {number}" for part in range(3) for number in range(2)
+    ]
@@ -0,0 +1,78 @@
+import threading
+
+import fitz
+
+from core.barcode_generator import BarcodeGenerator
+from core.pdf_handler import PDFHandler
+
+
+def make_template(path):
+    doc = fitz.open()
+    doc.new_page(width=595, height=842)
+    doc.new_page(width=842, height=595)
+    doc.save(path)
+
+
+def test_page_queries_do_not_wait_for_a_running_render(tmp_path):
+    template = str(tmp_path / 'template.pdf')
+    make_template(template)
+    handler = PDFHandler()
+    assert handler.load_pdf(template)
+    
+    rendering = threading.Event()
+    finish = threading.Event()
+    
+    def render():
+        # 描画スレッドが重いページを描画している状態を再現する
+        with handler._render_lock:
+            rendering.set()
+            finish.wait(5)
+    
+    renderer = threading.Thread(target=render)
+    renderer.start()
+    rendering.wait(5)
+    results = {}
+    query = threading.Thread(target=lambda: results.update(
+        size=handler.get_page_size(1),
+        plan=handler.compile_plan([{'page': 1, 'x': 10, 'y': 20, 'size': 'M'}], {'M': (100, 50)})))
+    query.start()
+    query.join(2)
+    finish.set()
+    renderer.join()
+    
+    assert not query.is_alive()
+    assert results['size'] == (842, 595)
+    assert results['plan'].on_page(1)[0].pdf_y == 595 - 20 - 50
+
+
+def test_render_uses_its_own_document(tmp_path):
+    template = str(tmp_path / 'template.pdf')
+    make_template(template)
+    handler = PDFHandler()
+    handler.load_pdf(template)
+    
+    pix = handler.get_page_pixmap(0, zoom=0.5)
+    
+    assert (pix.width, pix.height) == (298, 421)
+    assert handler._render_document is not handler.pdf_document
+    assert handler.get_cached_page_pixmap(0, 0.5) is pix
+
+
+def test_pypdf2_output_shares_repeated_code_images(tmp_path):
+    template = str(tmp_path / 'template.pdf')
+    output = str(tmp_path / 'output.pdf')
+    make_template(template)
+    data = [{'barcode': f'R{i:06d}', 'name': f'N{i:06d}'} for i in range(4)]
+    # 同じレコードのコードを両方のページに同じサイズで配置する
+    positions = [{'page': 0, 'x': 50, 'y': 100, 'size': 'M'}, {'page': 1, 'x': 50, 'y': 100, 'size': 'M'}]
+    
+    assert PDFHandler().add_codes_continuous(template, output, data, positions,
+                                             BarcodeGenerator(dpi=300), {'M': (150, 80)})
+    
+    doc = fitz.open(output)
+    images = [[xref for xref, *_ in page.get_images()] for page in doc]
+    assert len(doc) == 8
+    assert all(len(xrefs) == 1 for xrefs in images)
+    assert len({xref for xrefs in images for xref in xrefs}) == 4
+    # レコードごとに2ページが同じ画像を参照する
+    assert all(images[i] == images[i + 1] for i in range(0, 8, 2))
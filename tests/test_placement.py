@@ -0,0 +1,39 @@
+from core.placement import PlacementPlan
+
+SIZES = {'S': (100, 50), 'L': (200, 80)}
+PAGE_SIZES = [(595, 842), (842, 595)]
+
+
+def test_plan_groups_positions_by_page_in_input_order():
+    positions = [
+        {'page': 1, 'x': 10, 'y': 20, 'size': 'S'},
+        {'page': 0, 'x': 30, 'y': 40, 'size': 'L'},
+        {'page': 1, 'x': 50, 'y': 60, 'size': 'L'},
+    ]
+    
+    plan = PlacementPlan(positions, SIZES, PAGE_SIZES)
+    
+    assert plan.page_count == 2
+    assert len(plan) == 3
+    assert [placement.index for placement in plan.on_page(0)] == [1]
+    assert [placement.index for placement in plan.on_page(1)] == [0, 2]
+    # 反復はページ順、ページ内は指定順
+    assert [placement.index for placement in plan] == [1, 0, 2]
+
+
+def test_placement_converts_to_bottom_left_pdf_coordinates():
+    plan = PlacementPlan([{'page': 1, 'x': 10, 'y': 20, 'size': 'L'}], SIZES, PAGE_SIZES)
+    placement = plan.on_page(1)[0]
+    
+    assert (placement.width, placement.height) == (200, 80)
+    assert (placement.pdf_x, placement.pdf_y) == (10, 595 - 20 - 80)
+    assert placement.rect == (10, 20, 210, 100)
+
+
+def test_positions_outside_the_document_are_ignored():
+    positions = [{'page': 2, 'x': 0, 'y': 0, 'size': 'S'}, {'page': -1, 'x': 0, 'y': 0, 'size': 'S'}]
+    
+    plan = PlacementPlan(positions, SIZES, PAGE_SIZES)
+    
+    assert len(plan) == 0
+    assert plan.on_page(2) == []
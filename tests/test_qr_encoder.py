@@ -0,0 +1,58 @@
+import qrcode
+import pytest
+from qrcode import util
+
+from core.qr_encoder import QREncoder, build_capacity_table
+
+
+def best_fit_version(data, error_correction):
+    qr = qrcode.QRCode(version=1, error_correction=error_correction, border=0)
+    qr.add_data(util.QRData(data))
+    return qr.best_fit(start=1)
+
+
+@pytest.mark.parametrize('error_correction', [qrcode.constants.ERROR_CORRECT_L, qrcode.constants.ERROR_CORRECT_H])
+@pytest.mark.parametrize('alphabet', ['0123456789', 'ABCDEFGHIJ0123456789 $%*+-./:', 'abcdefghij-_?=&'])
+def test_capacity_table_picks_the_same_version_as_best_fit(error_correction, alphabet):
+    encoder = QREncoder(error_correction=error_correction, fast=True)
+    table = build_capacity_table(error_correction)
+    mode = util.QRData(alphabet[0]).mode
+    # 各バージョンの容量ちょうどと1文字超えの長さで比べる
+    for capacity in table[mode][:12]:
+        for length in (capacity, capacity + 1):
+            data = (alphabet * (length // len(alphabet) + 1))[:length]
+            assert encoder.version_for(util.QRData(data)) == best_fit_version(data, error_correction)
+
+
+def test_fast_mode_matrix_matches_standard_for_single_segment_data():
+    data = 'https://example.com/equipment/000123'
+    standard = QREncoder().matrix(data)
+    fast = QREncoder(fast=True).matrix(data)
+    
+    assert fast == standard
+
+
+def test_encoder_caches_matrices_with_lru_eviction():
+    encoder = QREncoder(max_entries=2)
+    first = encoder.matrix('A')
+    encoder.matrix('B')
+    assert encoder.matrix('A') is first
+    encoder.matrix('C')
+    
+    assert encoder.stats()['entries'] == 2
+    assert encoder.stats()['hits'] == 1
+    assert encoder.matrix('B') is not None
+    assert encoder.stats()['misses'] == 4
+
+
+def test_cached_mask_mode_records_the_mask_it_used_per_version():
+    encoder = QREncoder(fast=True, mask_pattern='cached')
+    for data in ('T000001', 'T000002', 'T999999'):
+        matrix = encoder.matrix(data)
+        mask, _ = encoder.stats()['masks'][1]
+        assert matrix == QREncoder(fast=True, mask_pattern=mask).matrix(data)
+
+
+def test_unknown_mask_pattern_is_rejected():
+    with pytest.raises(ValueError):
+        QREncoder(mask_pattern=8)
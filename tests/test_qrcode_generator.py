@@ -0,0 +1,25 @@
+import numpy as np
+
+from core.code_image import prepare_code_image
+from core.qrcode_generator import QRCodeGenerator
+
+
+def dark_width(img):
+    pixels = np.array(img.convert('L'))[:img.width]
+    columns = np.where((pixels < 128).any(axis=0))[0]
+    return columns.max() - columns.min() + 1
+
+
+def test_dpi_renders_at_printer_resolution_with_full_extent():
+    img = QRCodeGenerator(dpi=300).generate_qrcode_with_text('T000123', 'T000123', 100)
+    
+    assert img.size == (417, 521)
+    # バージョン1（21モジュール）+ 余白2モジュールずつ: 幅の 21/25 が黒の範囲
+    assert abs(dark_width(img) - 417 * 21 / 25) <= 2
+
+
+def test_prepare_keeps_width_and_matches_placement_aspect():
+    img = QRCodeGenerator(dpi=300).generate_qrcode_with_text('T000123', 'T000123', 100)
+    
+    prepared = prepare_code_image(img, 100, 100)
+    assert prepared.size == (417, 417)
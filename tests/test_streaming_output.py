@@ -0,0 +1,52 @@
+import fitz
+
+from core.barcode_generator import BarcodeGenerator
+from core.pdf_handler import PDFHandler
+from core.streaming_output import StreamingPdfOutput
+
+RECORDS = 30
+CHUNK_PAGES = 10
+
+
+def make_template(path):
+    doc = fitz.open()
+    for number in range(2):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Template page {number + 1}", fontsize=20)
+    doc.save(path)
+
+
+def run_job(template, output, stream):
+    data = [{'barcode': f'R{i:06d}', 'name': f'N{i:06d}'} for i in range(RECORDS)]
+    positions = [{'page': 0, 'x': 50, 'y': 100, 'size': 'M'}, {'page': 1, 'x': 50, 'y': 400, 'size': 'M'}]
+    handler = PDFHandler(engine='fitz', stream_output=stream, stream_chunk_pages=CHUNK_PAGES)
+    assert handler.add_codes_continuous(template, output, data, positions,
+                                        BarcodeGenerator(dpi=300), {'M': (150, 80)}, False)
+    return handler.last_stats
+
+
+def test_streamed_output_is_flushed_in_chunks_and_matches_size(tmp_path):
+    template = str(tmp_path / 'template.pdf')
+    make_template(template)
+    plain_pdf = str(tmp_path / 'plain.pdf')
+    streamed_pdf = str(tmp_path / 'streamed.pdf')
+    
+    plain = run_job(template, plain_pdf, stream=False)
+    streamed = run_job(template, streamed_pdf, stream=True)
+    
+    # 逐次書き出しはページ全体を保持せず、CHUNK_PAGES ページごとに追記保存する
+    assert plain['chunks'] == 1
+    assert streamed['chunks'] == RECORDS * 2 // CHUNK_PAGES
+    assert streamed['pages'] == fitz.open(streamed_pdf).page_count == RECORDS * 2
+    # 追記保存したストリームも圧縮されていること
+    assert (tmp_path / 'streamed.pdf').stat().st_size <= (tmp_path / 'plain.pdf').stat().st_size * 1.1
+
+
+def test_abort_removes_the_temporary_file(tmp_path):
+    output = StreamingPdfOutput(str(tmp_path / 'output.pdf'), chunk_pages=1)
+    output.doc.new_page()
+    output.pages_added()
+    
+    output.abort()
+    
+    assert list(tmp_path.iterdir()) == []